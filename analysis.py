@@ -0,0 +1,205 @@
+# Consultas de análisis sobre una base generada (diaria, normalizada o incremental):
+# agregados por Compania y estado, búsqueda por ICCID o teléfono y mayores consumos.
+#
+# Uso: python analysis.py <base.db> [--iccid ICCID | --telefono TELEFONO] [--top N]
+#
+# Los agregados salen de un solo GROUP BY (Compania, estado, sesión) que la interfaz guarda
+# en caché según la firma del archivo (ver db_signature). Las búsquedas usan índices: el
+# índice único (ICCID, TELEFONO) para el ICCID y un índice por TELEFONO que los cargadores
+# de database.py crean al cerrar la carga. El análisis solo lee la base.
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+from database import canonical_key, key_text_sql
+
+# Estados (ya normalizados a minúsculas por cleaning) que cuentan como SIM activa
+ACTIVE_STATES = ('activo', 'activa', 'activado', 'activada', 'active', 'activated')
+
+# Valores de EN_SESION que cuentan como SIM en sesión
+IN_SESSION_VALUES = ('sí', 'si', 'yes', 'true', '1', 'en sesión', 'en sesion', 'conectado', 'online')
+
+# Consumidores que se calculan una vez por base; la interfaz muestra un subconjunto
+TOP_CONSUMERS_LIMIT = 100
+
+RESULT_COLUMNS = ['ICCID', 'TELEFONO', 'ESTADO_DEL_SIM', 'EN_SESION', 'ConsumoMb', 'Compania']
+
+# Un solo recorrido de la tabla: conteo y consumo por (Compania, estado, sesión)
+CUBE_SQL = {
+    'text': '''
+        SELECT Compania, ESTADO_DEL_SIM, EN_SESION, COUNT(*), SUM(CAST(NULLIF(ConsumoMb, '') AS REAL))
+        FROM sims
+        GROUP BY Compania, ESTADO_DEL_SIM, EN_SESION
+    ''',
+    # En el esquema normalizado se agrupa por ids y los nombres se resuelven después
+    'normalized': '''
+        SELECT c.nombre, e.nombre, ses.nombre, g.sims, g.consumo
+        FROM (
+            SELECT compania_id, estado_sim_id, en_sesion_id, COUNT(*) AS sims, SUM(ConsumoMb) AS consumo
+            FROM sims_compact
+            GROUP BY compania_id, estado_sim_id, en_sesion_id
+        ) g
+        LEFT JOIN companias c ON c.id = g.compania_id
+        LEFT JOIN estados e ON e.id = g.estado_sim_id
+        LEFT JOIN estados ses ON ses.id = g.en_sesion_id
+    ''',
+}
+
+TOP_CONSUMERS_SQL = {
+    'text': '''
+        SELECT ICCID, TELEFONO, ESTADO_DEL_SIM, EN_SESION, CAST(ConsumoMb AS REAL) AS consumo, Compania
+        FROM sims
+        WHERE ConsumoMb IS NOT NULL AND ConsumoMb <> ''
+        ORDER BY consumo DESC
+        LIMIT ?
+    ''',
+    'normalized': '''
+        SELECT ICCID, TELEFONO, ESTADO_DEL_SIM, EN_SESION, ConsumoMb, Compania
+        FROM sims
+        WHERE ConsumoMb IS NOT NULL
+        ORDER BY ConsumoMb DESC
+        LIMIT ?
+    ''',
+}
+
+# Búsquedas: en el esquema normalizado se consulta sims_compact con la clave canónica para
+# que SQLite use la clave primaria o el índice (la vista sims convierte las claves a texto)
+LOOKUP_SQL = {
+    'text': "SELECT ICCID, TELEFONO, ESTADO_DEL_SIM, EN_SESION, ConsumoMb, Compania FROM sims WHERE {column} = ? LIMIT ?",
+    'normalized': f'''
+        SELECT {key_text_sql('s.ICCID')}, {key_text_sql('s.TELEFONO')}, e.nombre, ses.nombre, s.ConsumoMb, c.nombre
+        FROM sims_compact s
+        LEFT JOIN estados e ON e.id = s.estado_sim_id
+        LEFT JOIN estados ses ON ses.id = s.en_sesion_id
+        LEFT JOIN companias c ON c.id = s.compania_id
+        WHERE s.{{column}} = ?
+        LIMIT ?
+    ''',
+}
+
+# Filas como máximo en el resultado de una búsqueda
+LOOKUP_LIMIT = 1_000
+
+# Función para obtener la firma de una base (tamaño y fecha de modificación, también del WAL
+# del modo incremental); cambia cada vez que se escribe, así que sirve de clave de caché
+def db_signature(db_path):
+    signature = []
+    for path in (db_path, db_path + '-wal'):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        signature.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+# Función para abrir una base en solo lectura
+def open_readonly(db_path):
+    return sqlite3.connect(Path(db_path).resolve().as_uri() + '?mode=ro', uri=True)
+
+# Función para identificar el esquema: 'normalized' (sims_compact y vista sims) o 'text'
+# (tabla sims de la base diaria o del almacén incremental)
+def detect_schema(conn):
+    found = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sims_compact'").fetchone()
+    return 'normalized' if found else 'text'
+
+# Función para obtener el cubo de conteos por (Compania, ESTADO_DEL_SIM, EN_SESION)
+def load_cube(db_path):
+    conn = open_readonly(db_path)
+    try:
+        rows = conn.execute(CUBE_SQL[detect_schema(conn)]).fetchall()
+    finally:
+        conn.close()
+    cube = pd.DataFrame(rows, columns=['Compania', 'ESTADO_DEL_SIM', 'EN_SESION', 'SIMs', 'ConsumoMb'])
+    cube['ConsumoMb'] = cube['ConsumoMb'].fillna(0.0)
+    cube['activa'] = cube['ESTADO_DEL_SIM'].isin(ACTIVE_STATES)
+    cube['en_sesion'] = cube['EN_SESION'].isin(IN_SESSION_VALUES)
+    return cube
+
+# Función para resumir el cubo por Compania: SIMs, activas, en sesión y consumo total
+def summary_by_compania(cube):
+    summary = cube.assign(
+        Activas=cube['SIMs'].where(cube['activa'], 0),
+        En_sesion=cube['SIMs'].where(cube['en_sesion'], 0),
+    ).groupby('Compania', dropna=False)[['SIMs', 'Activas', 'En_sesion', 'ConsumoMb']].sum()
+    return summary.rename(columns={'En_sesion': 'En sesión', 'ConsumoMb': 'ConsumoMb total'}).sort_values('SIMs', ascending=False)
+
+# Función para resumir el cubo por estado del SIM (filas) y Compania (columnas)
+def summary_by_state(cube):
+    return cube.pivot_table(index='ESTADO_DEL_SIM', columns='Compania', values='SIMs', aggfunc='sum', fill_value=0)
+
+# Función para obtener los mayores consumidores de ConsumoMb
+def top_consumers(db_path, limit=TOP_CONSUMERS_LIMIT):
+    conn = open_readonly(db_path)
+    try:
+        rows = conn.execute(TOP_CONSUMERS_SQL[detect_schema(conn)], (limit,)).fetchall()
+    finally:
+        conn.close()
+    return pd.DataFrame(rows, columns=RESULT_COLUMNS)
+
+# Función para buscar SIMs por ICCID o por teléfono (column es 'ICCID' o 'TELEFONO');
+# el valor se reduce a dígitos como en la limpieza
+def lookup(db_path, column, value, limit=LOOKUP_LIMIT):
+    if column not in ('ICCID', 'TELEFONO'):
+        raise ValueError(f"Columna de búsqueda no soportada: {column}")
+    digits = ''.join(filter(str.isdigit, str(value)))
+    conn = open_readonly(db_path)
+    try:
+        schema = detect_schema(conn)
+        key = canonical_key(digits) if schema == 'normalized' else digits
+        rows = conn.execute(LOOKUP_SQL[schema].format(column=column), (key, limit)).fetchall()
+        result = pd.DataFrame(rows, columns=RESULT_COLUMNS)
+        # En el almacén incremental se agrega la bitácora de cambios de las SIMs encontradas
+        has_changes = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sims_changes'").fetchone()
+        changes = None
+        if has_changes and rows:
+            changes = pd.DataFrame(
+                [
+                    change
+                    for iccid, telefono in {(row[0], row[1]) for row in rows}
+                    for change in conn.execute(
+                        "SELECT ICCID, TELEFONO, Campo, Anterior, Nuevo, Fecha FROM sims_changes WHERE ICCID = ? AND TELEFONO = ? ORDER BY Fecha",
+                        (iccid, telefono)
+                    )
+                ],
+                columns=['ICCID', 'TELEFONO', 'Campo', 'Anterior', 'Nuevo', 'Fecha']
+            )
+    finally:
+        conn.close()
+    return result, changes
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resumen y búsquedas sobre una base 'dei Sims'.")
+    parser.add_argument('db_path', help="Base generada (diaria, normalizada o incremental)")
+    search = parser.add_mutually_exclusive_group()
+    search.add_argument('--iccid', help="Buscar por ICCID")
+    search.add_argument('--telefono', help="Buscar por teléfono")
+    parser.add_argument('--top', type=int, default=10, help="Mayores consumidores a mostrar")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if not os.path.exists(args.db_path):
+        logging.error(f"No existe la base {args.db_path}")
+        return 1
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        if args.iccid or args.telefono:
+            column, value = ('ICCID', args.iccid) if args.iccid else ('TELEFONO', args.telefono)
+            result, changes = lookup(args.db_path, column, value)
+            print(result.to_string(index=False) if not result.empty else "Sin resultados.")
+            if changes is not None and not changes.empty:
+                print(changes.to_string(index=False))
+            return 0
+        cube = load_cube(args.db_path)
+        print(summary_by_compania(cube).to_string())
+        print()
+        print(summary_by_state(cube).to_string())
+        print()
+        print(top_consumers(args.db_path, args.top).to_string(index=False))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,229 @@
+# Modo por lotes sin interfaz: procesa un directorio de exportaciones de operadores
+# aplicando los mapeos predeterminados y genera la base "dei Sims (YYYY-MM-DD).db".
+#
+# Uso: python batch.py <directorio> [--output-dir DIR] [--workers N] [--batch-size N] [--normalized | --incremental]
+#                      [--precedence COMPANIA1,COMPANIA2,...] [--export parquet,csv.gz]
+#
+# Cada pestaña de Excel y cada CSV se extrae en un proceso independiente; los lotes
+# llegan por una cola acotada al proceso principal, que es el único escritor de SQLite y
+# descarta los duplicados entre archivos antes de insertar (ver dedup.py). Con --export los
+# mismos lotes se escriben además como Parquet particionado y/o CSV gzip (ver exports.py).
+#
+# El directorio de salida se crea si no existe. Ahí mismo se leen los mapeos aprendidos
+# (mapeos_aprendidos.json) y se agregan las métricas de la ejecución (procesamiento_metricas.jsonl).
+import argparse
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from database import LOADERS, default_output_filename, PERSISTENT_DB_FILENAME
+from cleaning import clean_batch
+from dedup import Deduplicator, load_batch, task_compania
+from exports import EXPORT_FORMATS, open_exporters
+from extraction import DEFAULT_BATCH_SIZE, open_workbook, probe_workbook, process_csv, process_excel
+from ingest_logging import RejectsLog, configure_logging
+from mappings import LEARNED_MAPPINGS_FILE, find_default_mapping
+from metrics import METRICS_LOG, TaskMetrics, task_bytes, write_metrics
+
+# Lotes en tránsito como máximo entre los procesos de extracción y el escritor
+QUEUE_MAX_BATCHES = 16
+
+_batch_queue = None
+
+def _init_worker(batch_queue):
+    global _batch_queue
+    _batch_queue = batch_queue
+
+# Función que corre en cada proceso: extrae y limpia una pestaña o CSV y envía sus lotes a la cola
+# junto con sus registros rechazados. La marca de fin lleva las métricas de parse, extract y clean
+def _extract_task(task_id, task, batch_size):
+    metrics = TaskMetrics(task['file'], task['sheet'], task_bytes(task, task['path']))
+    workbook = None
+    if task['kind'] == 'xlsx':
+        with metrics.measure('parse'):
+            workbook = open_workbook(task['path'])
+        batches = process_excel(workbook, task['mapping'], task['sheet'], batch_size=batch_size)
+    else:
+        batches = process_csv(task['path'], task['mapping'], company_name=task_compania(task), batch_size=batch_size)
+    rows = 0
+    try:
+        for batch in metrics.timed_batches(batches):
+            rejects = []
+            with metrics.measure('clean', len(batch)):
+                cleaned, report = clean_batch(batch, rejects)
+            _batch_queue.put((task_id, cleaned, report, rejects))
+            rows += len(cleaned)
+    finally:
+        if workbook is not None:
+            workbook.close()
+    _batch_queue.put((task_id, None, metrics, None))
+    return rows
+
+# Función para armar la lista de tareas (archivo, pestaña, mapeo) de un directorio;
+# learned_path es el archivo de mapeos aprendidos que se consulta antes que los predeterminados
+def discover_tasks(input_dir, learned_path=LEARNED_MAPPINGS_FILE):
+    tasks = []
+    for file_name in sorted(os.listdir(input_dir)):
+        path = os.path.join(input_dir, file_name)
+        if file_name.endswith('.xlsx'):
+            workbook = probe_workbook(path)
+            for sheet_name in workbook['sheetnames']:
+                header_row = workbook['sheets'][sheet_name]['header']
+                profile, mapping = find_default_mapping(sheet_name, header_row, learned_path)
+                if mapping is None:
+                    logging.warning(f"Archivo: {file_name} | Pestaña: {sheet_name} | Sin mapeo predeterminado aplicable. Pestaña omitida.")
+                    continue
+                logging.info(f"Archivo: {file_name} | Pestaña: {sheet_name} | Perfil: {profile} | Mapeo: {mapping}")
+                tasks.append({'kind': 'xlsx', 'path': path, 'file': file_name, 'sheet': sheet_name, 'mapping': mapping,
+                              'sheet_bytes': workbook['sheets'][sheet_name]['bytes']})
+        elif file_name.endswith('.csv'):
+            header_row = pd.read_csv(path, dtype=str, nrows=0).columns.tolist()
+            profile, mapping = find_default_mapping(os.path.splitext(file_name)[0], header_row, learned_path)
+            if mapping is None:
+                logging.warning(f"Archivo: {file_name} | CSV | Sin mapeo predeterminado aplicable. Archivo omitido.")
+                continue
+            logging.info(f"Archivo: {file_name} | CSV | Perfil: {profile} | Mapeo: {mapping}")
+            tasks.append({'kind': 'csv', 'path': path, 'file': file_name, 'sheet': None, 'mapping': mapping})
+    return tasks
+
+# Función para ejecutar todas las tareas en paralelo con un único escritor.
+# Devuelve (estadísticas por archivo con la misma forma que usa la interfaz, tareas que fallaron).
+# mode es una clave de LOADERS; en modo incremental se actualiza output_path en lugar de reconstruirlo.
+# precedence es la lista de compañías en orden de prioridad para resolver claves repetidas. Las
+# tareas se lanzan en ese orden; si por el paralelismo una fila de mayor prioridad llega después,
+# reemplaza a la ya cargada. Las métricas se agregan a METRICS_LOG junto a output_path.
+def run_batch(tasks, output_path, workers=None, batch_size=DEFAULT_BATCH_SIZE, mode='daily', precedence=(), exports=()):
+    if mode != 'incremental' and os.path.exists(output_path):
+        os.remove(output_path)
+        logging.info(f"Archivo existente {output_path} eliminado para nueva ejecución.")
+
+    base_path = os.path.splitext(output_path)[0]
+    dedup = Deduplicator(precedence, f"{base_path} conflictos.csv")
+    tasks = dedup.sort_tasks(tasks)
+
+    stats_by_file = {}
+    for task in tasks:
+        if task['kind'] == 'xlsx':
+            stats_by_file.setdefault(task['file'], {'sheets': {}})['sheets'][task['sheet']] = {'processed': 0, 'inserted': 0, 'validation': {}, 'dedup': {}}
+        else:
+            stats_by_file[task['file']] = {'processed': 0, 'inserted': 0, 'validation': {}, 'dedup': {}}
+
+    def task_stats(task):
+        if task['kind'] == 'xlsx':
+            return stats_by_file[task['file']]['sheets'][task['sheet']]
+        return stats_by_file[task['file']]
+
+    # Inserción y commit se miden en el escritor; el resto llega con la marca de fin de cada tarea
+    task_metrics = [TaskMetrics(task['file'], task['sheet']) for task in tasks]
+    # Los rechazos se escriben junto a la base, como "<base> rechazos.csv"
+    rejects_log = RejectsLog(f"{base_path} rechazos.csv")
+    for path in (rejects_log.path, dedup.conflicts_path):
+        if os.path.exists(path):
+            os.remove(path)
+
+    exporters = open_exporters(exports, base_path)
+
+    context = multiprocessing.get_context('spawn')
+    batch_queue = context.Queue(maxsize=QUEUE_MAX_BATCHES)
+    loader = LOADERS[mode](output_path)
+    with loader, ProcessPoolExecutor(
+        max_workers=workers, mp_context=context, initializer=_init_worker, initargs=(batch_queue,)
+    ) as executor:
+        futures = {task_id: executor.submit(_extract_task, task_id, task, batch_size) for task_id, task in enumerate(tasks)}
+        pending = set(futures)
+        failed = []
+        while pending:
+            try:
+                task_id, batch, report, rejects = batch_queue.get(timeout=1)
+            except queue.Empty:
+                # Una tarea que falló nunca envía su marca de fin
+                for task_id in list(pending):
+                    future = futures[task_id]
+                    if future.done() and future.exception() is not None:
+                        task = tasks[task_id]
+                        logging.error(f"Error procesando {task['file']} ({task['sheet'] or 'CSV'}): {future.exception()}")
+                        failed.append(task)
+                        pending.discard(task_id)
+                continue
+            if batch is None:
+                task_metrics[task_id].merge(report)
+                task = tasks[task_id]
+                rejects_log.log_summary(task['file'], task['sheet'], task_stats(task)['validation'])
+                pending.discard(task_id)
+                continue
+            rejects_log.add(tasks[task_id]['file'], tasks[task_id]['sheet'], rejects)
+            load_batch(batch, report, task_stats(tasks[task_id]), dedup, loader, exporters, task_metrics[task_id])
+        if task_metrics:
+            with task_metrics[-1].measure('commit'):
+                loader.commit()
+    rejects_log.close()
+    dedup.close()
+    for fmt, exporter in exporters.items():
+        start = time.perf_counter()
+        exporter.close()
+        if task_metrics:
+            task_metrics[-1].add('export', time.perf_counter() - start)
+        logging.info(f"Exportación {fmt}: {exporter.rows} registros en {exporter.directory}")
+    logging.info(f"Base de datos generada: {output_path} ({loader.inserted} registros insertados, "
+                 f"{dedup.duplicates} duplicados descartados, {dedup.replaced} reemplazados por prioridad)")
+    if dedup.conflicts:
+        logging.warning(f"{dedup.conflicts} SIMs en varias compañías con estados distintos; detalle en {dedup.conflicts_path}")
+    if rejects_log.rows:
+        logging.warning(f"{rejects_log.rows} registros no pasaron la validación; detalle en {rejects_log.path}")
+    for metrics in task_metrics:
+        for record in metrics.records():
+            logging.info(f"Archivo: {record['file']} | {record['sheet'] or 'CSV'} | Etapa: {record['stage']} | "
+                         f"{record['seconds']:.2f} s | {record['rows_per_second'] or 0:.0f} filas/s")
+    write_metrics(task_metrics, uuid.uuid4().hex, output_path, mode,
+                  path=os.path.join(os.path.dirname(os.path.abspath(output_path)), METRICS_LOG))
+    if failed:
+        logging.error(f"{len(failed)} de {len(tasks)} tareas fallaron; la base {output_path} está incompleta")
+    return stats_by_file, failed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Homologa un directorio de exportaciones de SIMs en una base SQLite.")
+    parser.add_argument('input_dir', help="Directorio con archivos .xlsx y .csv")
+    parser.add_argument('--output-dir', default='.',
+                        help="Directorio donde se escribe la base generada (se crea si no existe)")
+    parser.add_argument('--workers', type=int, default=None, help="Procesos de extracción (por defecto, uno por núcleo)")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--precedence', default='',
+                        help="Compañías en orden de prioridad, separadas por comas, para resolver claves repetidas entre archivos")
+    parser.add_argument('--export', default='',
+                        help=f"Formatos adicionales a la base, separados por comas: {', '.join(EXPORT_FORMATS)}")
+    schema = parser.add_mutually_exclusive_group()
+    schema.add_argument('--normalized', action='store_true',
+                        help="Generar el esquema normalizado compacto (diccionarios, ConsumoMb REAL, WITHOUT ROWID)")
+    schema.add_argument('--incremental', action='store_true',
+                        help=f"Actualizar el almacén persistente '{PERSISTENT_DB_FILENAME}' (upsert con bitácora de cambios)")
+    args = parser.parse_args(argv)
+    exports = [fmt.strip() for fmt in args.export.split(',') if fmt.strip()]
+    for fmt in exports:
+        if fmt not in EXPORT_FORMATS:
+            parser.error(f"Formato de exportación desconocido: {fmt} (disponibles: {', '.join(EXPORT_FORMATS)})")
+    try:
+        os.makedirs(args.output_dir, exist_ok=True)
+    except OSError as e:
+        parser.error(f"No se puede usar {args.output_dir} como directorio de salida: {e}")
+
+    configure_logging()
+    tasks = discover_tasks(args.input_dir, os.path.join(args.output_dir, LEARNED_MAPPINGS_FILE))
+    if not tasks:
+        logging.error(f"No se encontraron archivos procesables en {args.input_dir}")
+        return 1
+    mode = 'incremental' if args.incremental else 'normalized' if args.normalized else 'daily'
+    output_filename = PERSISTENT_DB_FILENAME if mode == 'incremental' else default_output_filename()
+    output_path = os.path.join(args.output_dir, output_filename)
+    precedence = [compania.strip() for compania in args.precedence.split(',') if compania.strip()]
+    _, failed = run_batch(tasks, output_path, workers=args.workers, batch_size=args.batch_size, mode=mode, precedence=precedence, exports=exports)
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+# Benchmark de la etapa de limpieza: bucle por fila original (clean_iccid_telefono_consumo)
+# contra la limpieza columnar de cleaning.clean_batch
+#
+# Uso: python benchmarks/bench_cleaning.py --rows 1000000
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from cleaning import clean_batch
+
+# Función para generar un lote sintético con valores sucios como los de las exportaciones
+def generate_batch(rows, seed=0):
+    rng = random.Random(seed)
+    states = [' Activado', 'SUSPENDIDO ', 'Inventario', 'desactivado']
+    consumos = [lambda: f"{rng.random() * 500:.2f}", lambda: f"{rng.random() * 4:.1f} GB",
+                lambda: f"{rng.randrange(1, 900)} KB", lambda: "", lambda: f"{rng.randrange(1000, 9000):,}"]
+    batch = []
+    for i in range(rows):
+        iccid = f"8952{rng.randrange(10**15):015d}"
+        if i % 11 == 0:
+            iccid = f"{iccid[:4]} {iccid[4:12]} {iccid[12:]}"
+        telefono = f"{5500000000 + i}.0" if i % 7 == 0 else str(5500000000 + i)
+        batch.append((iccid, telefono, rng.choice(states), rng.choice(['Sí', 'No']), rng.choice(consumos)(), 'TELCEL'))
+    return batch
+
+# Limpieza original por fila, conservada solo como referencia de comparación.
+# Con log=True escribe, como en producción, una línea de log por registro
+def clean_legacy(data, log=False):
+    cleaned_data = []
+    for row in data:
+        cleaned_row = list(row)
+        iccid_value = row[0]
+        if isinstance(iccid_value, float) and iccid_value.is_integer():
+            cleaned_iccid = str(int(iccid_value))
+        else:
+            cleaned_iccid = str(iccid_value)
+        cleaned_row[0] = ''.join(filter(str.isdigit, cleaned_iccid)) if cleaned_iccid else ""
+        telefono_value = row[1]
+        if isinstance(telefono_value, float) and telefono_value.is_integer():
+            cleaned_telefono = str(int(telefono_value))
+        else:
+            cleaned_telefono = str(telefono_value)
+        cleaned_row[1] = ''.join(filter(str.isdigit, cleaned_telefono)) if cleaned_telefono else ""
+        consumo_mb_value = row[4]
+        cleaned_row[4] = ''.join(filter(str.isdigit, consumo_mb_value)) if consumo_mb_value else ""
+        cleaned_row[2] = cleaned_row[2].strip().lower() if cleaned_row[2] else ""
+        cleaned_row[3] = cleaned_row[3].strip().lower() if cleaned_row[3] else ""
+        cleaned_data.append(tuple(cleaned_row))
+        if log:
+            logging.info(f"Limpieza Registro: ICCID '{row[0]}' a '{cleaned_row[0]}', TELEFONO '{row[1]}' a '{cleaned_row[1]}', ConsumoMb '{row[4]}' a '{cleaned_row[4]}'")
+    return cleaned_data
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la limpieza de lotes")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--batch-size', type=int, default=None, help="Limpiar en lotes de este tamaño (por defecto, un solo lote)")
+    parser.add_argument('--skip-legacy', action='store_true')
+    parser.add_argument('--legacy-log', action='store_true', help="Incluir la línea de log por registro del bucle original")
+    args = parser.parse_args()
+
+    batch = generate_batch(args.rows)
+    batch_size = args.batch_size or args.rows
+
+    start = time.perf_counter()
+    report_total = {}
+    for offset in range(0, len(batch), batch_size):
+        _, report = clean_batch(batch[offset:offset + batch_size])
+        for key, value in report.items():
+            report_total[key] = report_total.get(key, 0) + value
+    elapsed = time.perf_counter() - start
+    print(f"columnar: {args.rows} filas en {elapsed:.2f}s ({args.rows / elapsed:,.0f} filas/s) {report_total}")
+
+    if not args.skip_legacy:
+        with tempfile.TemporaryDirectory() as tmp:
+            if args.legacy_log:
+                logging.basicConfig(level=logging.INFO, filename=os.path.join(tmp, 'bench.log'), filemode='w',
+                                    format='%(asctime)s - %(levelname)s - %(message)s')
+            start = time.perf_counter()
+            clean_legacy(batch, log=args.legacy_log)
+            legacy_elapsed = time.perf_counter() - start
+            logging.shutdown()
+        label = "original (con log por fila)" if args.legacy_log else "original"
+        print(f"{label}: {args.rows} filas en {legacy_elapsed:.2f}s ({args.rows / legacy_elapsed:,.0f} filas/s)")
+
+if __name__ == '__main__':
+    main()
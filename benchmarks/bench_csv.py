@@ -0,0 +1,79 @@
+# Benchmark de throughput: bucle iterrows/regex original contra el pipeline vectorizado
+# (process_csv seguido de clean_batch)
+#
+# Uso: python benchmarks/bench_csv.py --rows 200000 --batch-size 50000
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from cleaning import clean_batch
+from extraction import FIELDS, process_csv
+
+HEADER = ['ICCID', 'MSISDN', 'Estado de SIM', 'En sesión', 'Uso de ciclo hasta la fecha (MB)', 'Plan', 'Notas']
+
+# Función para generar un CSV sintético con la forma de una exportación de operador
+def generate_csv(path, rows, seed=0):
+    rng = random.Random(seed)
+    states = ['Activado', 'Suspendido', 'Inventario', 'Desactivado']
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(','.join(HEADER) + '\n')
+        for i in range(rows):
+            iccid = f"8952{rng.randrange(10**15):015d}"
+            telefono = f"{5500000000 + i}.0" if i % 7 == 0 else str(5500000000 + i)
+            f.write(f"{iccid},{telefono},{rng.choice(states)},{rng.choice(['Sí', 'No'])},{rng.random() * 500:.2f},Plan {i % 5},\n")
+
+# Bucle original (iterrows + re por celda), conservado solo como referencia de comparación
+def process_csv_legacy(file_path, column_mapping):
+    df = pd.read_csv(file_path, dtype=str)
+    all_data = []
+    for index, row in df.iterrows():
+        row_data = []
+        for key in FIELDS:
+            cell = row.get(column_mapping[key], "")
+            if pd.notnull(cell):
+                cell = cell.strip()
+                if re.match(r'^\d+\.\0+$', cell):
+                    cell_value = str(int(float(cell)))
+                else:
+                    cell_value = re.sub(r'[^\d]', '', cell)
+            else:
+                cell_value = ""
+            row_data.append(cell_value)
+        row_data.append("CSV")
+        all_data.append(row_data)
+    return all_data
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de process_csv")
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--batch-size', type=int, default=50_000)
+    parser.add_argument('--skip-legacy', action='store_true', help="No ejecutar el bucle original (lento con millones de filas)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.csv')
+        generate_csv(path, args.rows)
+        positions = {key: i for i, key in enumerate(FIELDS)}
+        names = {key: HEADER[i] for i, key in enumerate(FIELDS)}
+
+        start = time.perf_counter()
+        rows = sum(len(clean_batch(batch)[0]) for batch in process_csv(path, positions, batch_size=args.batch_size))
+        elapsed = time.perf_counter() - start
+        print(f"vectorizado: {rows} filas en {elapsed:.2f}s ({rows / elapsed:,.0f} filas/s)")
+
+        if not args.skip_legacy:
+            start = time.perf_counter()
+            legacy_rows = len(process_csv_legacy(path, names))
+            legacy_elapsed = time.perf_counter() - start
+            print(f"original:    {legacy_rows} filas en {legacy_elapsed:.2f}s ({legacy_rows / legacy_elapsed:,.0f} filas/s)")
+            print(f"aceleración: {legacy_elapsed / elapsed:.1f}x")
+
+if __name__ == '__main__':
+    main()
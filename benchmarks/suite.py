@@ -0,0 +1,256 @@
+# Suite de benchmarks reproducible de la ingesta con exportaciones sintéticas.
+#
+# Genera archivos xlsx y CSV con la forma de cada perfil de default_mappings (mismos
+# encabezados, columnas extra y una proporción configurable de duplicados) y mide por
+# separado cada etapa: carga del libro (apertura y encabezado), extracción, limpieza e
+# inserción. Como en la ingesta, cada lote pasa por limpieza e inserción apenas se extrae,
+# sin juntar el archivo en memoria. Cada caso corre en un proceso nuevo para que el pico de
+# RSS reportado sea solo el suyo.
+#
+# Uso:
+#   python benchmarks/suite.py run --sizes 10000,100000,1000000 --dup-ratio 0.05 --output resultados.json
+#   python benchmarks/suite.py compare base.json nuevo.json
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import openpyxl
+import pandas as pd
+
+from cleaning import clean_batch
+from database import LOADERS
+from extraction import open_workbook, probe_workbook, process_csv, process_excel
+from mappings import default_mappings, resolve_default_mapping
+from metrics import TaskMetrics
+
+STAGES = ['load', 'extract', 'clean', 'insert']
+
+# Columnas que no están en ningún mapeo, como en las exportaciones reales
+EXTRA_COLUMNS = ['Plan', 'Fecha Activación', 'Notas']
+
+STATES = ['Activado', 'Suspendido', 'Inventario', 'Desactivado', 'Listo para activar']
+
+# Función para completar un ICCID con su dígito de control Luhn
+def luhn_complete(partial):
+    total = 0
+    for i, char in enumerate(reversed(partial)):
+        digit = int(char)
+        if i % 2 == 0:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return partial + str((10 - total % 10) % 10)
+
+# Función para elegir el generador de valores de una columna según el campo que alimenta
+def column_generator(field, rng):
+    if field == 'ICCID':
+        return lambda i: luhn_complete(f"8952{rng.randrange(10**14):014d}")
+    if field == 'TELEFONO':
+        return lambda i: str(5500000000 + i)
+    if field == 'ESTADO DEL SIM':
+        return lambda i: rng.choice(STATES)
+    if field == 'EN SESION':
+        return lambda i: rng.choice(['Sí', 'No'])
+    if field == 'ConsumoMb':
+        return lambda i: f"{rng.random() * 2048:.2f}"
+    return lambda i: rng.choice(['Plan A', 'Plan B', '2024-01-31', ''])
+
+# Función para armar encabezados y generadores de un perfil (una columna por nombre)
+def profile_columns(profile, rng):
+    columns = {}
+    for field, column_name in default_mappings[profile].items():
+        columns.setdefault(column_name, column_generator(field, rng))
+    for column_name in EXTRA_COLUMNS:
+        columns.setdefault(column_name, column_generator(None, rng))
+    return list(columns), list(columns.values())
+
+# Función para generar las filas sintéticas de un perfil; una fracción dup_ratio repite
+# el ICCID y TELEFONO de una fila anterior
+def generate_rows(profile, rows, dup_ratio, seed):
+    rng = random.Random(seed)
+    header, generators = profile_columns(profile, rng)
+    mapping = resolve_default_mapping(profile, header)
+    key_positions = (mapping['ICCID'], mapping['TELEFONO'])
+    previous_keys = []
+    for i in range(rows):
+        row = [generate(i) for generate in generators]
+        if previous_keys and rng.random() < dup_ratio:
+            row[key_positions[0]], row[key_positions[1]] = rng.choice(previous_keys)
+        elif len(previous_keys) < 100_000:
+            previous_keys.append((row[key_positions[0]], row[key_positions[1]]))
+        yield row
+
+# Función para escribir (o reutilizar, si ya existe) el archivo sintético de un caso
+def synthetic_file(data_dir, profile, fmt, rows, dup_ratio, seed):
+    safe_profile = profile.replace(' ', '_')
+    path = os.path.join(data_dir, f"{safe_profile}_{rows}_{dup_ratio}_{seed}.{fmt}")
+    if os.path.exists(path):
+        return path
+    header, _ = profile_columns(profile, random.Random(seed))
+    tmp_path = path + '.tmp'
+    if fmt == 'xlsx':
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet(profile)
+        sheet.append(header)
+        for row in generate_rows(profile, rows, dup_ratio, seed):
+            sheet.append(row)
+        workbook.save(tmp_path)
+    else:
+        pd.DataFrame(generate_rows(profile, rows, dup_ratio, seed), columns=header).to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return path
+
+# Función que mide un caso completo; corre en un proceso aparte
+def run_case(case):
+    path = case['path']
+    metrics = TaskMetrics(os.path.basename(path), case['profile'])
+
+    workbook = None
+    with metrics.measure('load'):
+        if case['format'] == 'xlsx':
+            workbook = open_workbook(path)
+            header = probe_workbook(path)['sheets'][case['profile']]['header']
+        else:
+            header = pd.read_csv(path, dtype=str, nrows=0).columns.tolist()
+        mapping = resolve_default_mapping(case['profile'], header)
+
+    if workbook is not None:
+        batches = process_excel(workbook, mapping, case['profile'], batch_size=case['batch_size'])
+    else:
+        batches = process_csv(path, mapping, company_name=case['profile'], batch_size=case['batch_size'])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            with LOADERS[case['db_mode']](os.path.join(tmp, 'bench.db')) as loader:
+                for batch in metrics.timed_batches(batches):
+                    with metrics.measure('clean', len(batch)):
+                        rows, _ = clean_batch(batch)
+                    with metrics.measure('insert', len(rows)):
+                        loader.insert(rows)
+                # El commit final se cuenta como parte de la inserción
+                with metrics.measure('insert'):
+                    loader.commit()
+        finally:
+            batches.close()
+            if workbook is not None:
+                workbook.close()
+
+    timings = {stage: metrics.stages.get(stage, {'seconds': 0.0})['seconds'] for stage in STAGES}
+    return {
+        'timings': timings,
+        'rows_per_second': {stage: (case['rows'] / seconds if seconds else None) for stage, seconds in timings.items()},
+        'processed': loader.processed,
+        'inserted': loader.inserted,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+# Función para obtener el commit actual (si el árbol es un repositorio git)
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def command_run(args):
+    profiles = args.profiles.split(',') if args.profiles else list(default_mappings)
+    sizes = [int(size) for size in args.sizes.split(',')]
+    formats = args.formats.split(',')
+    os.makedirs(args.data_dir, exist_ok=True)
+
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for size in sizes:
+        for profile in profiles:
+            for fmt in formats:
+                path = synthetic_file(args.data_dir, profile, fmt, size, args.dup_ratio, args.seed)
+                case = {
+                    'profile': profile,
+                    'format': fmt,
+                    'rows': size,
+                    'dup_ratio': args.dup_ratio,
+                    'db_mode': args.db_mode,
+                    'batch_size': args.batch_size,
+                    'path': path,
+                }
+                with context.Pool(1) as pool:
+                    measurement = pool.apply(run_case, (case,))
+                case.pop('path')
+                result = {**case, 'file_bytes': os.path.getsize(path), **measurement}
+                results.append(result)
+                stages = ' '.join(f"{stage}={result['timings'][stage]:.2f}s" for stage in STAGES)
+                print(f"{profile:>16} {fmt:>4} {size:>8} filas | {stages} | pico RSS {result['peak_rss_mb']:.0f} MB")
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Resultados escritos en {args.output}")
+
+def command_compare(args):
+    with open(args.base, encoding='utf-8') as f:
+        base = json.load(f)
+    with open(args.new, encoding='utf-8') as f:
+        new = json.load(f)
+
+    def case_key(result):
+        return (result['profile'], result['format'], result['rows'], result['dup_ratio'], result['db_mode'])
+
+    base_results = {case_key(result): result for result in base['results']}
+    print(f"base: {base.get('revision')} ({base['created_at']})  nuevo: {new.get('revision')} ({new['created_at']})")
+    print("Valores < 1.00 indican que la versión nueva es más rápida / usa menos memoria")
+    for result in new['results']:
+        previous = base_results.get(case_key(result))
+        if previous is None:
+            continue
+        ratios = ' '.join(
+            f"{stage}={result['timings'][stage] / previous['timings'][stage]:.2f}x"
+            for stage in STAGES if previous['timings'].get(stage)
+        )
+        rss = result['peak_rss_mb'] / previous['peak_rss_mb'] if previous['peak_rss_mb'] else float('nan')
+        print(f"{result['profile']:>16} {result['format']:>4} {result['rows']:>8} | {ratios} | RSS={rss:.2f}x")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de la ingesta con exportaciones sintéticas")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="Generar datos sintéticos y medir cada etapa")
+    run_parser.add_argument('--sizes', default='10000,100000,1000000', help="Filas por archivo, separadas por comas")
+    run_parser.add_argument('--profiles', default=None, help="Perfiles de default_mappings (por defecto, todos)")
+    run_parser.add_argument('--formats', default='xlsx,csv')
+    run_parser.add_argument('--dup-ratio', type=float, default=0.05, help="Fracción de filas con ICCID/TELEFONO repetido")
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--db-mode', choices=list(LOADERS), default='daily')
+    run_parser.add_argument('--batch-size', type=int, default=50_000)
+    run_parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'integrador_sims_bench'),
+                            help="Directorio donde se generan (y reutilizan) los archivos sintéticos")
+    run_parser.add_argument('--output', default='bench_results.json')
+    run_parser.set_defaults(func=command_run)
+
+    compare_parser = subparsers.add_parser('compare', help="Comparar dos archivos de resultados")
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('new')
+    compare_parser.set_defaults(func=command_compare)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+from operator import itemgetter
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Columnas de cada lote, en el orden de la tabla sims
+BATCH_COLUMNS = ['ICCID', 'TELEFONO', 'ESTADO_DEL_SIM', 'EN_SESION', 'ConsumoMb', 'Compania']
+
+# Columnas del archivo de rechazos: motivo y valores originales del registro
+REJECT_COLUMNS = ['motivo'] + BATCH_COLUMNS
+
+# Longitudes aceptadas para un ICCID (E.118: hasta 19 dígitos más el dígito de control)
+ICCID_MIN_LENGTH = 18
+ICCID_MAX_LENGTH = 22
+
+# Factores de conversión a MB según la unidad (sin unidad se asume MB)
+MB_UNITS = {'': 1.0, 'B': 1 / 1024 ** 2, 'KB': 1 / 1024, 'MB': 1.0, 'GB': 1024.0, 'TB': 1024.0 ** 2}
+
+# Número y unidad opcional, sin distinguir mayúsculas (KiB/MiB/GiB equivalen a KB/MB/GB)
+MB_PATTERN = r'(?i)^(?P<number>[-+]?\d+(?:\.\d+)?)\s*(?:(?P<prefix>[KMGT]?)I?(?P<unit>B))?$'
+
+# Equivalente de cada dígito duplicado en el algoritmo de Luhn (2*d, restando 9 si pasa de 9)
+LUHN_DOUBLED = np.array([0, 2, 4, 6, 8, 1, 3, 5, 7, 9], dtype=np.uint8)
+
+# Función para convertir una columna del lote a un arreglo de texto de pyarrow, con los
+# faltantes (None o NaN) como cadena vacía; devuelve también la lista de valores, igualada
+# al arreglo, para reutilizar al final los que la limpieza no cambia
+def string_column(values):
+    try:
+        column = pa.array(values, pa.string())
+    except (pa.ArrowTypeError, pa.ArrowInvalid):
+        values = [None if value is None or value != value else str(value) for value in values]
+        column = pa.array(values, pa.string())
+    if column.null_count:
+        values = ["" if value is None else value for value in values]
+        column = pc.fill_null(column, "")
+    return values, column
+
+# Función para pasar una columna limpia a lista reutilizando los valores originales que no
+# cambiaron: convertir cadenas de pyarrow a objetos de Python es lo más caro del lote
+def changed_values(values, original, cleaned):
+    changed = np.flatnonzero(pc.fill_null(pc.not_equal(original, cleaned), True).to_numpy(zero_copy_only=False))
+    if len(changed) * 2 > len(values):
+        return cleaned.to_pylist()
+    values = list(values)
+    for index, value in zip(changed.tolist(), cleaned.take(changed).to_pylist()):
+        values[index] = value
+    return values
+
+# Función para extraer solo los dígitos de una columna sin perder ceros a la izquierda;
+# un sufijo '.0' (enteros leídos como flotantes) se descarta en la misma pasada. La
+# expresión regular solo se aplica a los valores que no son ya dígitos ASCII
+def clean_digits_column(column):
+    dirty = pc.invert(pc.ascii_is_decimal(column))
+    if not pc.any(dirty).as_py():
+        return column
+    fixed = pc.replace_substring_regex(column.filter(dirty), r'\.0+$|\D', "")
+    return pc.replace_with_mask(column, dirty, fixed)
+
+# Función para normalizar columnas de texto (estado, sesión): sin espacios y en minúsculas
+def normalize_text_column(column):
+    return pc.utf8_lower(pc.utf8_trim_whitespace(column))
+
+# Función para convertir una columna de consumo a MB: acepta unidades (B, KB, MB, GB, TB,
+# también KiB/MiB/GiB), coma decimal y separadores de miles. Lo no numérico queda como NaN.
+# Todas las operaciones son expresiones regulares (RE2) y conversiones nativas de pyarrow
+def parse_mb_column(column):
+    has_comma = pc.match_substring(column, ",")
+    if pc.any(has_comma).as_py():
+        # Una coma seguida de exactamente tres dígitos es separador de miles; cualquier otra, decimal
+        fixed = pc.replace_substring_regex(column.filter(has_comma), r',(\d{3})\b', r'\1')
+        column = pc.replace_with_mask(column, has_comma, pc.replace_substring(fixed, ",", "."))
+    matched = pc.extract_regex(column, MB_PATTERN)
+    number = pc.cast(pc.struct_field(matched, 'number'), pa.float64())
+    unit = pc.utf8_upper(pc.binary_join_element_wise(pc.struct_field(matched, 'prefix'), pc.struct_field(matched, 'unit'), ""))
+    # Los valores que no coinciden quedan sin unidad (null) y les toca el factor NaN del final
+    factors = np.append(np.array(list(MB_UNITS.values())), np.nan)
+    unit_index = pc.fill_null(pc.index_in(unit, value_set=pa.array(list(MB_UNITS))), len(MB_UNITS))
+    return number.to_numpy(zero_copy_only=False) * factors[unit_index.to_numpy()]
+
+# Función para dar formato de texto a los MB (enteros sin '.0', máximo tres decimales);
+# la conversión a texto la hace pyarrow en lote, con la representación más corta
+def format_mb_column(values):
+    text = pc.cast(pa.array(np.round(values, 3), from_pandas=True), pa.string())
+    return pc.fill_null(text, "")
+
+# Función para validar ICCIDs (ya reducidos a dígitos) de forma vectorizada.
+# Devuelve dos arreglos booleanos: longitud válida y dígito de control Luhn válido.
+def validate_iccid_column(digits):
+    lengths = pc.utf8_length(digits).to_numpy()
+    length_ok = (lengths >= ICCID_MIN_LENGTH) & (lengths <= ICCID_MAX_LENGTH)
+    # Matriz de bytes de ancho fijo alineada a la derecha: los ceros de relleno no suman, y
+    # contando desde la derecha se duplican las posiciones impares (columnas pares aquí)
+    padded = pc.utf8_lpad(pc.utf8_slice_codeunits(digits, 0, ICCID_MAX_LENGTH), ICCID_MAX_LENGTH, "0")
+    offsets = np.frombuffer(padded.buffers()[1], dtype=np.int32)[padded.offset:padded.offset + len(padded) + 1]
+    matrix = np.frombuffer(padded.buffers()[2], dtype=np.uint8)[offsets[0]:offsets[-1]].reshape(-1, ICCID_MAX_LENGTH) - ord('0')
+    doubled_start = ICCID_MAX_LENGTH % 2
+    total = (LUHN_DOUBLED[matrix[:, doubled_start::2]].sum(axis=1, dtype=np.int32)
+             + matrix[:, 1 - doubled_start::2].sum(axis=1, dtype=np.int32))
+    luhn_ok = length_ok & (total % 10 == 0)
+    return length_ok, luhn_ok
+
+# Función para limpiar un lote en forma columnar: ICCID y TELEFONO a dígitos, estados
+# normalizados y ConsumoMb convertido a MB. Devuelve (filas limpias, conteos de validación).
+# Si se pasa una lista en rejects, se le agregan (motivo, *valores originales) de los
+# registros que no pasan la validación
+def clean_batch(batch, rejects=None):
+    if not batch:
+        return [], {'iccid_longitud_invalida': 0, 'iccid_luhn_invalido': 0, 'consumo_no_numerico': 0}
+    columns = [string_column(list(map(itemgetter(position), batch))) for position in range(len(BATCH_COLUMNS) - 1)]
+    (iccid_values, raw_iccid), (telefono_values, raw_telefono), (estado_values, raw_estado), \
+        (sesion_values, raw_sesion), (consumo_values, raw_consumo) = columns
+    iccid = clean_digits_column(raw_iccid)
+    telefono = clean_digits_column(raw_telefono)
+    estado = normalize_text_column(raw_estado)
+    sesion = normalize_text_column(raw_sesion)
+    stripped_consumo = pc.utf8_trim_whitespace(raw_consumo)
+    consumo = parse_mb_column(stripped_consumo)
+    formatted_consumo = format_mb_column(consumo)
+
+    length_ok, luhn_ok = validate_iccid_column(iccid)
+    consumo_invalid = np.isnan(consumo) & (pc.binary_length(stripped_consumo).to_numpy() > 0)
+    report = {
+        'iccid_longitud_invalida': int((~length_ok).sum()),
+        'iccid_luhn_invalido': int((length_ok & ~luhn_ok).sum()),
+        'consumo_no_numerico': int(consumo_invalid.sum()),
+    }
+    if rejects is not None:
+        for i in np.flatnonzero(~luhn_ok | consumo_invalid).tolist():
+            if not length_ok[i]:
+                reason = 'iccid_longitud_invalida'
+            elif not luhn_ok[i]:
+                reason = 'iccid_luhn_invalido'
+            else:
+                reason = 'consumo_no_numerico'
+            rejects.append((reason, *batch[i]))
+    rows = list(zip(
+        changed_values(iccid_values, raw_iccid, iccid),
+        changed_values(telefono_values, raw_telefono, telefono),
+        changed_values(estado_values, raw_estado, estado),
+        changed_values(sesion_values, raw_sesion, sesion),
+        changed_values(consumo_values, raw_consumo, formatted_consumo),
+        list(map(itemgetter(len(BATCH_COLUMNS) - 1), batch))
+    ))
+    return rows, report
+
+# Función para acumular los conteos de validación de un lote en los de una pestaña o archivo
+def merge_report(total, report):
+    for key, value in report.items():
+        total[key] = total.get(key, 0) + value
+    return total
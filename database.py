@@ -0,0 +1,405 @@
+import sqlite3
+import logging
+import hashlib
+import time
+from datetime import date, datetime
+
+# Pragmas para la base diaria desechable: sin journal, sin fsync y caché de páginas grande
+LOAD_PRAGMAS = (
+    "PRAGMA journal_mode = OFF",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA cache_size = -262144",  # 256 MB (valor negativo = KiB)
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA locking_mode = EXCLUSIVE",
+)
+
+# Pragmas para el almacén persistente del modo incremental: WAL y fsync en cada checkpoint
+PERSISTENT_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -262144",
+    "PRAGMA temp_store = MEMORY",
+)
+
+# Nombre del almacén que se conserva entre ejecuciones en modo incremental
+PERSISTENT_DB_FILENAME = "dei Sims.db"
+
+# Filas que se acumulan antes de cerrar cada transacción durante la carga
+DEFAULT_COMMIT_ROWS = 200_000
+
+INSERT_SQL = "INSERT OR IGNORE INTO sims (ICCID, TELEFONO, ESTADO_DEL_SIM, EN_SESION, ConsumoMb, Compania) VALUES (?, ?, ?, ?, ?, ?)"
+REPLACE_SQL = "INSERT OR REPLACE INTO sims (ICCID, TELEFONO, ESTADO_DEL_SIM, EN_SESION, ConsumoMb, Compania) VALUES (?, ?, ?, ?, ?, ?)"
+
+# Función para obtener el nombre del archivo de salida para una fecha (hoy por defecto)
+def default_output_filename(day=None):
+    day = day or date.today()
+    return f"dei Sims ({day.strftime('%Y-%m-%d')}).db"
+
+# Función para crear la tabla sims (la unicidad la garantiza el índice de create_indexes)
+def create_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sims (
+            ICCID TEXT,
+            TELEFONO TEXT,
+            ESTADO_DEL_SIM TEXT,
+            EN_SESION TEXT,
+            ConsumoMb TEXT,
+            Compania TEXT
+        )
+    ''')
+
+# Función para crear el índice único sobre (ICCID, TELEFONO)
+def create_indexes(conn):
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_sims_iccid_telefono ON sims (ICCID, TELEFONO)")
+
+# Función para crear el índice por TELEFONO que usan las búsquedas de analysis.py; se crea
+# una sola vez al cerrar la carga, no fila a fila durante la inserción
+def create_lookup_indexes(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sims_telefono ON sims (TELEFONO)")
+
+# Cargador que mantiene una sola conexión durante toda la ejecución e inserta en
+# transacciones por bloques. Los registros insertados se toman de total_changes.
+class SimsLoader:
+    pragmas = LOAD_PRAGMAS
+
+    def __init__(self, db_path, commit_rows=DEFAULT_COMMIT_ROWS):
+        self.db_path = db_path
+        self.commit_rows = commit_rows
+        self.pending_rows = 0
+        self.processed = 0
+        self.inserted = 0
+        # Tiempo acumulado en commits, para separarlo del de inserción en las métricas
+        self.commit_seconds = 0.0
+        self.conn = sqlite3.connect(db_path)
+        for pragma in self.pragmas:
+            self.conn.execute(pragma)
+        self.create_schema()
+        self.conn.commit()
+
+    def create_schema(self):
+        create_tables(self.conn)
+        create_indexes(self.conn)
+
+    def create_lookup_indexes(self):
+        create_lookup_indexes(self.conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # Inserta un lote y devuelve (registros procesados, registros insertados)
+    def insert(self, data):
+        if not isinstance(data, list):
+            data = list(data)
+        changes_before = self.conn.total_changes
+        self.conn.executemany(INSERT_SQL, data)
+        inserted = self.conn.total_changes - changes_before
+        self.pending_rows += len(data)
+        if self.pending_rows >= self.commit_rows:
+            self.commit()
+        self.processed += len(data)
+        self.inserted += inserted
+        return len(data), inserted
+
+    # Reemplaza las filas ya cargadas con la misma clave (la deduplicación decidió que las
+    # nuevas tienen prioridad) y devuelve cuántas se escribieron
+    def replace(self, data):
+        if not isinstance(data, list):
+            data = list(data)
+        self.conn.executemany(REPLACE_SQL, data)
+        self.pending_rows += len(data)
+        if self.pending_rows >= self.commit_rows:
+            self.commit()
+        return len(data)
+
+    def commit(self):
+        start = time.perf_counter()
+        self.conn.commit()
+        self.commit_seconds += time.perf_counter() - start
+        self.pending_rows = 0
+
+    def close(self):
+        if self.conn is None:
+            return
+        try:
+            self.commit()
+            logging.info(f"Carga finalizada en {self.db_path}: {self.inserted} de {self.processed} registros insertados.")
+            start = time.perf_counter()
+            self.create_lookup_indexes()
+            self.conn.commit()
+            logging.info(f"Índices de búsqueda listos en {time.perf_counter() - start:.2f} s.")
+        finally:
+            self.conn.close()
+            self.conn = None
+
+# Campos cuyo cambio se registra en sims_changes
+TRACKED_FIELDS = ('ESTADO_DEL_SIM', 'EN_SESION', 'ConsumoMb')
+
+# Función para calcular el hash estable (64 bits con signo) del contenido no clave de una fila
+def row_content_hash(row):
+    content = '\x1f'.join('' if value is None else str(value) for value in row[2:6])
+    return int.from_bytes(hashlib.blake2b(content.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+# Función para preparar el almacén persistente: columnas de hash y fecha, bitácora de cambios
+# y tabla temporal de staging (agrega las columnas si la base venía del modo diario)
+def create_incremental_tables(conn):
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(sims)")}
+    if 'row_hash' not in columns:
+        conn.execute("ALTER TABLE sims ADD COLUMN row_hash INTEGER")
+    if 'updated_at' not in columns:
+        conn.execute("ALTER TABLE sims ADD COLUMN updated_at TEXT")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sims_changes (
+            ICCID TEXT,
+            TELEFONO TEXT,
+            Campo TEXT,
+            Anterior TEXT,
+            Nuevo TEXT,
+            Fecha TEXT
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sims_changes_key ON sims_changes (ICCID, TELEFONO)")
+    conn.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS staging (
+            ICCID TEXT,
+            TELEFONO TEXT,
+            ESTADO_DEL_SIM TEXT,
+            EN_SESION TEXT,
+            ConsumoMb TEXT,
+            Compania TEXT,
+            row_hash INTEGER,
+            PRIMARY KEY (ICCID, TELEFONO)
+        )
+    ''')
+
+# Cargador del modo incremental: en lugar de reconstruir la base, hace upsert sobre
+# (ICCID, TELEFONO), omite las filas cuyo hash de contenido no cambió y registra en
+# sims_changes los cambios de estado, sesión y consumo.
+class IncrementalSimsLoader(SimsLoader):
+    pragmas = PERSISTENT_PRAGMAS
+
+    def __init__(self, db_path, commit_rows=DEFAULT_COMMIT_ROWS):
+        super().__init__(db_path, commit_rows=commit_rows)
+        self.updated = 0
+        self.unchanged = 0
+        self.changes_logged = 0
+        create_incremental_tables(self.conn)
+        self.conn.commit()
+
+    # Inserta o actualiza un lote y devuelve (registros procesados, registros nuevos)
+    def insert(self, data):
+        if not isinstance(data, list):
+            data = list(data)
+        new_rows = self.upsert(data)
+        self.processed += len(data)
+        return len(data), new_rows
+
+    # El upsert ya actualiza las filas existentes con el contenido nuevo; las reemplazadas no
+    # se vuelven a contar como procesadas, igual que en SimsLoader.replace
+    def replace(self, data):
+        if not isinstance(data, list):
+            data = list(data)
+        self.upsert(data)
+        return len(data)
+
+    # Aplica el upsert de un lote (lista), acumula los conteos de nuevos, actualizados, sin
+    # cambios y cambios registrados, y devuelve los registros nuevos
+    def upsert(self, data):
+        now = datetime.now().isoformat(timespec='seconds')
+        conn = self.conn
+        # En staging una clave repetida dentro del lote conserva su última aparición
+        conn.executemany(
+            "INSERT OR REPLACE INTO staging VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (tuple(row) + (row_content_hash(row),) for row in data)
+        )
+        staged = conn.execute("SELECT COUNT(*) FROM staging").fetchone()[0]
+        new_rows = conn.execute('''
+            SELECT COUNT(*) FROM staging s
+            WHERE NOT EXISTS (SELECT 1 FROM sims t WHERE t.ICCID = s.ICCID AND t.TELEFONO = s.TELEFONO)
+        ''').fetchone()[0]
+        changes_before = conn.total_changes
+        for field in TRACKED_FIELDS:
+            conn.execute(f'''
+                INSERT INTO sims_changes (ICCID, TELEFONO, Campo, Anterior, Nuevo, Fecha)
+                SELECT s.ICCID, s.TELEFONO, '{field}', t.{field}, s.{field}, ?
+                FROM staging s JOIN sims t ON t.ICCID = s.ICCID AND t.TELEFONO = s.TELEFONO
+                WHERE s.row_hash IS NOT t.row_hash AND s.{field} IS NOT t.{field}
+            ''', (now,))
+        changes_logged = conn.total_changes - changes_before
+        changes_before = conn.total_changes
+        conn.execute('''
+            INSERT INTO sims (ICCID, TELEFONO, ESTADO_DEL_SIM, EN_SESION, ConsumoMb, Compania, row_hash, updated_at)
+            SELECT ICCID, TELEFONO, ESTADO_DEL_SIM, EN_SESION, ConsumoMb, Compania, row_hash, ? FROM staging WHERE true
+            ON CONFLICT (ICCID, TELEFONO) DO UPDATE SET
+                ESTADO_DEL_SIM = excluded.ESTADO_DEL_SIM,
+                EN_SESION = excluded.EN_SESION,
+                ConsumoMb = excluded.ConsumoMb,
+                Compania = excluded.Compania,
+                row_hash = excluded.row_hash,
+                updated_at = excluded.updated_at
+            WHERE sims.row_hash IS NOT excluded.row_hash
+        ''', (now,))
+        written = conn.total_changes - changes_before
+        conn.execute("DELETE FROM staging")
+
+        updated = written - new_rows
+        self.pending_rows += len(data)
+        if self.pending_rows >= self.commit_rows:
+            self.commit()
+        self.inserted += new_rows
+        self.updated += updated
+        self.unchanged += staged - written
+        self.changes_logged += changes_logged
+        return new_rows
+
+    def close(self):
+        if self.conn is not None:
+            logging.info(f"Modo incremental en {self.db_path}: {self.inserted} nuevos, {self.updated} actualizados, {self.unchanged} sin cambios, {self.changes_logged} cambios registrados.")
+        super().close()
+
+# Función para crear el esquema normalizado: diccionarios de compañías y estados, tabla
+# WITHOUT ROWID agrupada por (ICCID, TELEFONO) con columnas tipadas, un índice secundario
+# (compania_id, estado_sim_id) que cubre los conteos por compañía y por estado, y una
+# vista sims con las mismas columnas que el esquema de texto
+def create_normalized_tables(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS companias (id INTEGER PRIMARY KEY, nombre TEXT NOT NULL UNIQUE)")
+    conn.execute("CREATE TABLE IF NOT EXISTS estados (id INTEGER PRIMARY KEY, nombre TEXT NOT NULL UNIQUE)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sims_compact (
+            ICCID NOT NULL,
+            TELEFONO NOT NULL,
+            estado_sim_id INTEGER REFERENCES estados (id),
+            en_sesion_id INTEGER REFERENCES estados (id),
+            ConsumoMb REAL,
+            compania_id INTEGER REFERENCES companias (id),
+            PRIMARY KEY (ICCID, TELEFONO)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sims_compact_compania ON sims_compact (compania_id, estado_sim_id)")
+    conn.execute(f'''
+        CREATE VIEW IF NOT EXISTS sims AS
+        SELECT {key_text_sql('s.ICCID')} AS ICCID, {key_text_sql('s.TELEFONO')} AS TELEFONO, e.nombre AS ESTADO_DEL_SIM, ses.nombre AS EN_SESION,
+               s.ConsumoMb, c.nombre AS Compania
+        FROM sims_compact s
+        LEFT JOIN estados e ON e.id = s.estado_sim_id
+        LEFT JOIN estados ses ON ses.id = s.en_sesion_id
+        LEFT JOIN companias c ON c.id = s.compania_id
+    ''')
+
+# Máximo entero con signo de 64 bits que SQLite almacena como INTEGER
+SQLITE_MAX_INT = 2**63 - 1
+
+# Prefijo de industria de los ICCID (telecomunicaciones, UIT-T E.118). Un ICCID de 20 dígitos
+# no cabe en 64 bits; si empieza con este prefijo se guarda como el entero negativo
+# -(resto + 1), donde el resto son sus 18 dígitos siguientes (siempre < 10**18)
+ICCID_PREFIX = '89'
+PACKED_KEY_DIGITS = 20
+
+# Función para llevar un ICCID o teléfono a su forma canónica compacta: solo dígitos,
+# guardados como entero cuando caben en 64 bits y no tienen ceros a la izquierda, o como
+# entero negativo si son 20 dígitos con el prefijo de ICCID (ambas conversiones son
+# reversibles, ver key_text_sql); en otro caso se conservan como texto
+def canonical_key(value):
+    if value is None:
+        return ""
+    digits = ''.join(filter(str.isdigit, str(value)))
+    if digits and digits[0] != '0':
+        if int(digits) <= SQLITE_MAX_INT:
+            return int(digits)
+        if len(digits) == PACKED_KEY_DIGITS and digits.startswith(ICCID_PREFIX):
+            return -int(digits[len(ICCID_PREFIX):]) - 1
+    return digits
+
+# Función para obtener la expresión SQL que devuelve una clave canónica a su texto original
+def key_text_sql(column):
+    rest_digits = PACKED_KEY_DIGITS - len(ICCID_PREFIX)
+    return (
+        f"CASE WHEN typeof({column}) = 'integer' AND {column} < 0 "
+        f"THEN '{ICCID_PREFIX}' || printf('%0{rest_digits}d', -{column} - 1) "
+        f"ELSE CAST({column} AS TEXT) END"
+    )
+
+# Función para convertir ConsumoMb a número (None si el valor no es numérico)
+def parse_consumo(value):
+    if value is None:
+        return None
+    value = str(value).strip().replace(',', '')
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+# Cargador del esquema normalizado: resuelve compañías y estados a ids enteros con
+# diccionarios en memoria, guarda ConsumoMb como REAL y el ICCID en forma canónica.
+class NormalizedSimsLoader(SimsLoader):
+    def __init__(self, db_path, commit_rows=DEFAULT_COMMIT_ROWS):
+        self.dictionaries = {'companias': {}, 'estados': {}}
+        super().__init__(db_path, commit_rows=commit_rows)
+
+    def create_lookup_indexes(self):
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_sims_compact_telefono ON sims_compact (TELEFONO)")
+
+    def create_schema(self):
+        create_normalized_tables(self.conn)
+        for table, ids in self.dictionaries.items():
+            ids.update((nombre, id_) for id_, nombre in self.conn.execute(f"SELECT id, nombre FROM {table}"))
+
+    # Función para obtener el id de un valor en un diccionario, dándolo de alta si es nuevo
+    def dictionary_id(self, table, value):
+        value = (value or "").strip()
+        if not value:
+            return None
+        ids = self.dictionaries[table]
+        id_ = ids.get(value)
+        if id_ is None:
+            id_ = self.conn.execute(f"INSERT INTO {table} (nombre) VALUES (?)", (value,)).lastrowid
+            ids[value] = id_
+        return id_
+
+    # Función para convertir filas de texto a la forma compacta de sims_compact
+    def compact_rows(self, data):
+        return [
+            (
+                canonical_key(row[0]),
+                canonical_key(row[1]),
+                self.dictionary_id('estados', row[2]),
+                self.dictionary_id('estados', row[3]),
+                parse_consumo(row[4]),
+                self.dictionary_id('companias', row[5]),
+            )
+            for row in data
+        ]
+
+    def insert(self, data):
+        if not isinstance(data, list):
+            data = list(data)
+        rows = self.compact_rows(data)
+        changes_before = self.conn.total_changes
+        self.conn.executemany("INSERT OR IGNORE INTO sims_compact VALUES (?, ?, ?, ?, ?, ?)", rows)
+        inserted = self.conn.total_changes - changes_before
+        self.pending_rows += len(data)
+        if self.pending_rows >= self.commit_rows:
+            self.commit()
+        self.processed += len(data)
+        self.inserted += inserted
+        return len(data), inserted
+
+    def replace(self, data):
+        if not isinstance(data, list):
+            data = list(data)
+        self.conn.executemany("INSERT OR REPLACE INTO sims_compact VALUES (?, ?, ?, ?, ?, ?)", self.compact_rows(data))
+        self.pending_rows += len(data)
+        if self.pending_rows >= self.commit_rows:
+            self.commit()
+        return len(data)
+
+# Cargadores disponibles por modo de base de datos
+LOADERS = {
+    'daily': SimsLoader,
+    'normalized': NormalizedSimsLoader,
+    'incremental': IncrementalSimsLoader,
+}
@@ -0,0 +1,205 @@
+# Exportación columnar de los datos homologados, además de la base SQLite: Parquet
+# particionado por Compania y fecha (estilo Hive, "Compania=X/fecha=YYYY-MM-DD/") y CSV
+# comprimido con gzip en archivos de EXPORT_CSV_CHUNK_ROWS filas. Se escribe lote a lote
+# a medida que avanza la ingesta, sin juntar todos los registros en memoria.
+#
+# Las filas que la deduplicación reemplaza por prioridad (ver dedup.py) ya pueden estar
+# escritas; se recuerdan sus claves y al cerrar se reescriben, también por grupos de filas,
+# solo los archivos que contienen alguna.
+import csv
+import gzip
+import os
+import shutil
+import zipfile
+from datetime import date
+from urllib.parse import quote
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from cleaning import BATCH_COLUMNS
+
+# Formatos disponibles y el nombre con que se muestran
+EXPORT_FORMATS = {
+    'parquet': "Parquet particionado (Compania/fecha)",
+    'csv.gz': "CSV comprimido (gzip, por partes)",
+}
+
+# Filas por archivo en la exportación CSV
+EXPORT_CSV_CHUNK_ROWS = 1_000_000
+
+# Columnas de los archivos Parquet; Compania y fecha van en la ruta de la partición
+PARQUET_SCHEMA = pa.schema([
+    ('ICCID', pa.string()),
+    ('TELEFONO', pa.string()),
+    ('ESTADO_DEL_SIM', pa.string()),
+    ('EN_SESION', pa.string()),
+    ('ConsumoMb', pa.float64()),
+])
+
+# Función para armar un segmento de partición; el valor se codifica como URI para que
+# pyarrow.dataset (partitioning='hive') lo lea de vuelta tal cual
+def partition_segment(name, value):
+    return f"{name}={quote(str(value), safe='')}"
+
+# Base de los exportadores: recibe lotes limpios (tuplas en el orden de BATCH_COLUMNS)
+class Exporter:
+    def __init__(self, directory, day=None):
+        self.directory = directory
+        self.day = (day or date.today()).isoformat()
+        self.rows = 0
+        # Claves (ICCID, TELEFONO) reemplazadas por prioridad -> Compania que las conserva
+        self.superseded = {}
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.makedirs(directory)
+
+    def write(self, rows):
+        raise NotImplementedError
+
+    # Escribe filas que reemplazan a otras de menor prioridad ya exportadas
+    def replace(self, rows):
+        self.write(rows)
+        for row in rows:
+            self.superseded[(row[0], row[1])] = row[5]
+        self.rows -= len(rows)
+
+    def _close_files(self):
+        raise NotImplementedError
+
+    def _drop_superseded(self):
+        raise NotImplementedError
+
+    def close(self):
+        self._close_files()
+        if self.superseded:
+            self._drop_superseded()
+
+    # Función para descartar la exportación (p. ej. si la ingesta falló) y borrar su directorio
+    def remove(self):
+        self._close_files()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    # Función para comprimir el directorio exportado en un zip (sin recomprimir) para descargarlo
+    def archive(self, zip_path):
+        with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_STORED) as archive:
+            for folder, _, files in os.walk(self.directory):
+                for name in sorted(files):
+                    path = os.path.join(folder, name)
+                    archive.write(path, os.path.relpath(path, self.directory))
+        return zip_path
+
+# Parquet particionado: un ParquetWriter abierto por Compania y un grupo de filas por lote
+class ParquetExporter(Exporter):
+    def __init__(self, directory, day=None):
+        super().__init__(directory, day)
+        self.writers = {}
+        self.companias = []
+
+    def _path(self, compania):
+        return os.path.join(self.directory, partition_segment('Compania', compania), partition_segment('fecha', self.day), 'part-0.parquet')
+
+    def write(self, rows):
+        if not rows:
+            return
+        columns = dict(zip(BATCH_COLUMNS, zip(*rows)))
+        consumo = pa.array(columns['ConsumoMb'], pa.string())
+        consumo = pc.cast(pc.if_else(pc.equal(consumo, ""), None, consumo), pa.float64())
+        table = pa.table([
+            pa.array(columns['ICCID'], pa.string()),
+            pa.array(columns['TELEFONO'], pa.string()),
+            pa.array(columns['ESTADO_DEL_SIM'], pa.string()),
+            pa.array(columns['EN_SESION'], pa.string()),
+            consumo,
+        ], schema=PARQUET_SCHEMA)
+        compania = pa.array(columns['Compania'], pa.string())
+        for value in pc.unique(compania).to_pylist():
+            writer = self.writers.get(value)
+            if writer is None:
+                path = self._path(value)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                writer = self.writers[value] = pq.ParquetWriter(path, PARQUET_SCHEMA, compression='zstd')
+            writer.write_table(table.filter(pc.equal(compania, value)))
+        self.rows += len(rows)
+
+    def _close_files(self):
+        for writer in self.writers.values():
+            writer.close()
+        self.companias = list(self.writers)
+        self.writers = {}
+
+    # Reescribe cada partición sin las filas que otra Compania ganó por prioridad
+    def _drop_superseded(self):
+        for compania in self.companias:
+            keys = [f"{iccid}\x1f{telefono}" for (iccid, telefono), winner in self.superseded.items() if winner != compania]
+            if not keys:
+                continue
+            key_set = pa.array(keys, pa.string())
+            path = self._path(compania)
+            tmp_path = path + '.tmp'
+            source = pq.ParquetFile(path)
+            with pq.ParquetWriter(tmp_path, PARQUET_SCHEMA, compression='zstd') as writer:
+                for index in range(source.num_row_groups):
+                    group = source.read_row_group(index)
+                    key = pc.binary_join_element_wise(group['ICCID'], group['TELEFONO'], "\x1f")
+                    writer.write_table(group.filter(pc.invert(pc.is_in(key, value_set=key_set))))
+            source.close()
+            os.replace(tmp_path, path)
+
+# CSV con gzip en partes numeradas ("sims-00000.csv.gz", ...), cada una con su encabezado
+class CsvGzipExporter(Exporter):
+    def __init__(self, directory, day=None, chunk_rows=EXPORT_CSV_CHUNK_ROWS):
+        super().__init__(directory, day)
+        self.chunk_rows = chunk_rows
+        self.paths = []
+        self._file = None
+        self._writer = None
+        self._chunk_written = 0
+
+    def _open_chunk(self):
+        path = os.path.join(self.directory, f"sims-{len(self.paths):05d}.csv.gz")
+        self.paths.append(path)
+        self._file = gzip.open(path, 'wt', newline='', encoding='utf-8', compresslevel=6)
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(BATCH_COLUMNS + ['fecha'])
+        self._chunk_written = 0
+
+    def write(self, rows):
+        position = 0
+        while position < len(rows):
+            if self._file is None or self._chunk_written >= self.chunk_rows:
+                if self._file is not None:
+                    self._file.close()
+                self._open_chunk()
+            chunk = rows[position:position + self.chunk_rows - self._chunk_written]
+            self._writer.writerows((*row, self.day) for row in chunk)
+            self._chunk_written += len(chunk)
+            position += len(chunk)
+        self.rows += len(rows)
+
+    def _close_files(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # Reescribe cada parte sin las filas que otra Compania ganó por prioridad
+    def _drop_superseded(self):
+        for path in self.paths:
+            tmp_path = path + '.tmp'
+            with gzip.open(path, 'rt', newline='', encoding='utf-8') as source, \
+                    gzip.open(tmp_path, 'wt', newline='', encoding='utf-8', compresslevel=6) as target:
+                reader = csv.reader(source)
+                writer = csv.writer(target)
+                writer.writerow(next(reader))
+                writer.writerows(row for row in reader if self.superseded.get((row[0], row[1]), row[5]) == row[5])
+            os.replace(tmp_path, path)
+
+EXPORTERS = {
+    'parquet': ParquetExporter,
+    'csv.gz': CsvGzipExporter,
+}
+
+# Función para crear los exportadores pedidos; cada formato va en "<base> <formato>/"
+def open_exporters(formats, base_path, day=None):
+    return {fmt: EXPORTERS[fmt](f"{base_path} {fmt.split('.')[0]}", day) for fmt in formats}
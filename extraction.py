@@ -0,0 +1,267 @@
+import logging
+import posixpath
+import re
+import zipfile
+import openpyxl
+import pandas as pd
+from io import BytesIO
+from itertools import repeat
+from xml.etree.ElementTree import iterparse
+
+# Campos homologados, en el orden en que se insertan en la tabla sims
+FIELDS = ['ICCID', 'TELEFONO', 'ESTADO DEL SIM', 'EN SESION', 'ConsumoMb']
+
+# Número de filas que se entregan por lote a la etapa de inserción
+DEFAULT_BATCH_SIZE = 50_000
+
+# Función para abrir un libro en modo de solo lectura (acepta bytes, ruta o archivo)
+def open_workbook(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = BytesIO(source)
+    return openpyxl.load_workbook(source, read_only=True, data_only=True)
+
+# Función para leer solo los metadatos de un libro: pestañas, encabezados, max_column y filas
+def parse_workbook(source):
+    workbook = open_workbook(source)
+    try:
+        parsed = {'sheetnames': list(workbook.sheetnames), 'sheets': {}}
+        for sheet_name in workbook.sheetnames:
+            sheet = workbook[sheet_name]
+            # Una pestaña vacía se reporta con una columna vacía, como en modo normal
+            header_row = tuple(next(sheet.iter_rows(min_row=1, max_row=1, values_only=True), ())) or (None,)
+            parsed['sheets'][sheet_name] = {
+                'header': header_row,
+                'max_column': sheet.max_column or len(header_row),
+                # Filas de datos según la dimensión declarada en la hoja (None si no la declara)
+                'data_rows': sheet.max_row - 1 if sheet.max_row else None,
+                # Tamaño comprimido de la hoja dentro del libro (solo lo conoce probe_workbook)
+                'bytes': None
+            }
+        return parsed
+    finally:
+        workbook.close()
+
+# Referencia de celda ("AB12") separada en columna y fila
+CELL_REF_PATTERN = re.compile(r'^([A-Z]+)(\d+)$')
+
+# Función para quitar el espacio de nombres de una etiqueta XML
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+# Función para convertir letras de columna a índice (A -> 0)
+def _column_index(letters):
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+# Función para leer las relaciones (id -> ruta dentro del zip) de una parte del paquete
+def _read_relationships(archive, part):
+    rels_path = posixpath.join(posixpath.dirname(part), '_rels', posixpath.basename(part) + '.rels')
+    targets = {}
+    with archive.open(rels_path) as f:
+        for _, elem in iterparse(f):
+            if _local_name(elem.tag) == 'Relationship':
+                target = elem.get('Target')
+                if target.startswith('/'):
+                    target = target[1:]
+                else:
+                    target = posixpath.normpath(posixpath.join(posixpath.dirname(part), target))
+                targets[elem.get('Id')] = target
+    return targets
+
+# Función para leer la dimensión declarada y la fila 1 de una hoja, sin recorrer el resto.
+# Si la primera fila escrita no es la 1, el encabezado queda vacío (como en openpyxl).
+# Devuelve (celdas {columna: (tipo, valor)}, dimensión o None)
+def _probe_sheet(archive, sheet_path):
+    cells = {}
+    dimension = None
+    cell_type = cell_column = None
+    value = None
+    with archive.open(sheet_path) as f:
+        for event, elem in iterparse(f, events=('start', 'end')):
+            name = _local_name(elem.tag)
+            if event == 'start':
+                if name == 'row' and elem.get('r', '1') != '1':
+                    break
+                if name == 'c':
+                    cell_type = elem.get('t', 'n')
+                    match = CELL_REF_PATTERN.match(elem.get('r', ''))
+                    cell_column = _column_index(match.group(1)) if match else len(cells)
+                    value = None
+                continue
+            if name == 'dimension':
+                dimension = elem.get('ref')
+            elif name == 'v' or (name == 't' and cell_type == 'inlineStr'):
+                value = (value or '') + (elem.text or '')
+            elif name == 'c':
+                if value is not None:
+                    cells[cell_column] = (cell_type, value)
+                elem.clear()
+            elif name == 'row':
+                break
+    return cells, dimension
+
+# Función para leer del catálogo de cadenas compartidas solo las posiciones pedidas;
+# la lectura se detiene en la mayor posición necesaria
+def _read_shared_strings(archive, path, wanted):
+    strings = {}
+    if not wanted or path is None:
+        return strings
+    last = max(wanted)
+    position = 0
+    parts = []
+    in_phonetic = False
+    with archive.open(path) as f:
+        for event, elem in iterparse(f, events=('start', 'end')):
+            name = _local_name(elem.tag)
+            if event == 'start':
+                if name == 'si':
+                    parts = []
+                elif name == 'rPh':
+                    # Texto fonético: no forma parte del valor visible
+                    in_phonetic = True
+                continue
+            if name == 't' and not in_phonetic:
+                parts.append(elem.text or '')
+            elif name == 'rPh':
+                in_phonetic = False
+            elif name == 'si':
+                if position in wanted:
+                    strings[position] = ''.join(parts)
+                if position >= last:
+                    break
+                position += 1
+                elem.clear()
+    return strings
+
+# Función para convertir el valor crudo de una celda de encabezado como lo haría openpyxl
+def _header_value(cell_type, value, shared_strings):
+    if cell_type == 's':
+        return shared_strings.get(int(value))
+    if cell_type == 'b':
+        return value == '1'
+    if cell_type == 'n':
+        try:
+            number = float(value)
+        except ValueError:
+            return value
+        return int(number) if number.is_integer() and not re.search(r'[.eE]', value) else number
+    return value
+
+# Función para leer solo los encabezados de un libro: abre el paquete zip y, de cada hoja,
+# procesa la etiqueta de dimensión y la primera fila, y del catálogo de cadenas compartidas
+# solo lo necesario. Devuelve lo mismo que parse_workbook; si el paquete no tiene la forma
+# esperada se recurre a parse_workbook
+def probe_workbook(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = BytesIO(source)
+    try:
+        with zipfile.ZipFile(source) as archive:
+            workbook_path = next(
+                (target for target in _read_relationships(archive, '').values() if target.endswith('workbook.xml')),
+                'xl/workbook.xml'
+            )
+            relationships = _read_relationships(archive, workbook_path)
+            shared_strings_path = next((target for target in relationships.values() if target.endswith('sharedStrings.xml')), None)
+            sheets = []
+            with archive.open(workbook_path) as f:
+                for _, elem in iterparse(f):
+                    if _local_name(elem.tag) == 'sheet':
+                        relationship_id = next(value for key, value in elem.attrib.items() if _local_name(key) == 'id')
+                        sheets.append((elem.get('name'), relationships[relationship_id]))
+            probed = [(sheet_name, *_probe_sheet(archive, sheet_path)) for sheet_name, sheet_path in sheets]
+            sheet_bytes = {sheet_name: archive.getinfo(sheet_path).compress_size for sheet_name, sheet_path in sheets}
+            wanted = {int(value) for _, cells, _ in probed for cell_type, value in cells.values() if cell_type == 's'}
+            shared_strings = _read_shared_strings(archive, shared_strings_path, wanted)
+    except (zipfile.BadZipFile, KeyError, StopIteration, ValueError) as e:
+        logging.info(f"Lectura rápida de encabezados no disponible ({e}); se abre el libro completo")
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        return parse_workbook(source)
+
+    parsed = {'sheetnames': [sheet_name for sheet_name, _ in sheets], 'sheets': {}}
+    for sheet_name, cells, dimension in probed:
+        width = max(cells) + 1 if cells else 1
+        max_column = width
+        data_rows = None
+        if dimension:
+            last_cell = CELL_REF_PATTERN.match(dimension.split(':')[-1])
+            if last_cell:
+                max_column = max(width, _column_index(last_cell.group(1)) + 1)
+                data_rows = int(last_cell.group(2)) - 1
+        # Como openpyxl, el encabezado se completa hasta el ancho declarado de la hoja
+        header_row = [None] * max_column
+        for column, (cell_type, value) in cells.items():
+            header_row[column] = _header_value(cell_type, value, shared_strings)
+        parsed['sheets'][sheet_name] = {
+            'header': tuple(header_row),
+            'max_column': max_column,
+            'data_rows': data_rows,
+            'bytes': sheet_bytes[sheet_name],
+        }
+    return parsed
+
+# Función para convertir una celda a texto (los flotantes enteros pierden el '.0')
+def cell_to_str(cell):
+    if cell is None:
+        return ""
+    if isinstance(cell, float) and cell.is_integer():
+        return str(int(cell))
+    return str(cell)
+
+# Función para procesar una pestaña de Excel en streaming, leyendo solo las columnas mapeadas
+# y entregando lotes de tuplas listos para insertar. source puede ser también un libro ya
+# abierto con open_workbook; en ese caso quien lo abrió se encarga de cerrarlo
+def process_excel(source, column_mapping, sheet_name, batch_size=DEFAULT_BATCH_SIZE):
+    indices = [column_mapping.get(key) for key in FIELDS]
+    indices = [None if col_index is None or col_index == -1 else col_index for col_index in indices]
+    mapped = [col_index for col_index in indices if col_index is not None]
+    if not mapped:
+        return
+    min_col = min(mapped)
+    max_col = max(mapped)
+    offsets = [None if col_index is None else col_index - min_col for col_index in indices]
+
+    owns_workbook = not isinstance(source, openpyxl.Workbook)
+    workbook = open_workbook(source) if owns_workbook else source
+    try:
+        sheet = workbook[sheet_name]
+        batch = []
+        # Con min_col/max_col openpyxl rellena cada fila hasta el ancho pedido
+        for row in sheet.iter_rows(min_row=2, min_col=min_col + 1, max_col=max_col + 1, values_only=True):
+            record = [("" if offset is None else cell_to_str(row[offset])) for offset in offsets]
+            record.append(sheet_name)  # Añadir el nombre de la pestaña como 'Compania'
+            batch.append(tuple(record))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    finally:
+        if owns_workbook:
+            workbook.close()
+
+# Función para procesar archivos CSV por bloques de forma vectorizada. El mapeo es el
+# que produce la interfaz: posiciones enteras de columna (-1 si el campo no está mapeado).
+# La limpieza de valores se hace después, en cleaning.clean_batch
+def process_csv(source, column_mapping, company_name="CSV", batch_size=DEFAULT_BATCH_SIZE):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = BytesIO(source)
+    indices = {key: column_mapping.get(key) for key in FIELDS}
+    indices = {key: None if col_index is None or col_index == -1 else col_index for key, col_index in indices.items()}
+    usecols = sorted({col_index for col_index in indices.values() if col_index is not None})
+    if not usecols:
+        return
+    # Sin encabezado las columnas quedan etiquetadas por su posición, aunque haya nombres repetidos
+    chunks = pd.read_csv(source, dtype=str, header=None, skiprows=1, usecols=usecols, chunksize=batch_size)
+    for chunk in chunks:
+        columns = []
+        for key in FIELDS:
+            col_index = indices[key]
+            if col_index is None:
+                columns.append(repeat("", len(chunk)))
+                continue
+            columns.append(chunk[col_index].fillna("").tolist())
+        columns.append(repeat(company_name, len(chunk)))
+        yield list(zip(*columns))
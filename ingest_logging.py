@@ -0,0 +1,103 @@
+# Registro no bloqueante de la ingesta: los mensajes pasan por una cola acotada y un hilo
+# (QueueListener) los escribe en el destino, de modo que el procesamiento no espera al disco.
+# Los eventos por fila no se registran uno a uno: se agregan en conteos (cleaning.clean_batch),
+# una muestra pequeña de ejemplos y un archivo de rechazos, con un resumen por pestaña.
+import atexit
+import csv
+import logging
+import logging.handlers
+import queue
+
+from cleaning import REJECT_COLUMNS
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Mensajes en espera como máximo; si la cola se llena, los mensajes nuevos se descartan
+LOG_QUEUE_SIZE = 10_000
+
+# Ejemplos de registros rechazados que se incluyen en el resumen de cada pestaña
+REJECT_SAMPLE_SIZE = 5
+
+_listener = None
+
+# QueueHandler que descarta (y cuenta) los mensajes cuando la cola está llena en lugar de bloquear
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+# Función para configurar el logging raíz con cola y hilo escritor. Como basicConfig, no hace
+# nada si ya está configurado; sin filename se escribe en stderr
+def configure_logging(filename=None, filemode='a', level=logging.INFO):
+    global _listener
+    root = logging.getLogger()
+    if _listener is not None or root.handlers:
+        return
+    if filename:
+        handler = logging.FileHandler(filename, mode=filemode, encoding='utf-8')
+    else:
+        handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    queue_handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    _listener = logging.handlers.QueueListener(queue_handler.queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+# Función para vaciar la cola y detener el hilo escritor; si se descartaron mensajes, se
+# deja constancia directamente en el destino
+def stop_logging():
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    dropped = sum(handler.dropped for handler in logging.getLogger().handlers if isinstance(handler, DroppingQueueHandler))
+    if dropped:
+        record = logging.makeLogRecord({'levelno': logging.WARNING, 'levelname': 'WARNING',
+                                        'msg': f"{dropped} mensajes de log descartados por cola llena"})
+        for handler in _listener.handlers:
+            handler.handle(record)
+    _listener = None
+
+# Archivo de rechazos de una ejecución: los registros que no pasaron la validación se
+# escriben en CSV a medida que llegan, y se guarda una muestra por archivo y pestaña
+class RejectsLog:
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self.samples = {}
+        self._file = None
+        self._writer = None
+
+    def add(self, file_name, sheet, rejects):
+        if not rejects:
+            return
+        if self._file is None:
+            self._file = open(self.path, 'w', newline='', encoding='utf-8')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(['Archivo', 'Pestaña'] + REJECT_COLUMNS)
+        self._writer.writerows((file_name, sheet or 'CSV', *row) for row in rejects)
+        self.rows += len(rejects)
+        sample = self.samples.setdefault((file_name, sheet), [])
+        sample.extend(rejects[:REJECT_SAMPLE_SIZE - len(sample)])
+
+    # Una sola línea por pestaña o CSV con los conteos de validación y, si hubo rechazos,
+    # un aviso con algunos ejemplos
+    def log_summary(self, file_name, sheet, validation):
+        if not any(validation.values()):
+            logging.info(f"Archivo: {file_name} | {sheet or 'CSV'} | Validación: {validation}")
+            return
+        sample = self.samples.get((file_name, sheet), [])
+        logging.warning(f"Archivo: {file_name} | {sheet or 'CSV'} | Registros con observaciones: {validation} | Ejemplos: {sample}")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,198 @@
+# Ejecución en segundo plano del procesamiento iniciado desde la interfaz: cada trabajo
+# corre en un hilo aparte, reporta su avance por archivo y pestaña y puede cancelarse.
+# El registro de trabajos vive en este módulo, que Streamlit no vuelve a ejecutar entre
+# reruns, así que un trabajo sobrevive a los reruns y a la recarga de la página.
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from cleaning import clean_batch
+from database import LOADERS
+from dedup import Deduplicator, load_batch, task_compania
+from exports import open_exporters
+from extraction import open_workbook, process_csv, process_excel
+from ingest_logging import RejectsLog
+from metrics import TaskMetrics, task_bytes, write_metrics
+
+# Trabajos terminados que se conservan en el registro
+JOB_HISTORY = 20
+
+# Lotes más chicos que en el modo por lotes para que el avance se actualice seguido
+JOB_BATCH_SIZE = 10_000
+
+# Un solo hilo de trabajo: SQLite admite un escritor a la vez
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ingesta')
+_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+
+# Trabajo de ingesta. Cada tarea es un dict con 'kind' ('xlsx' o 'csv'), 'file', 'sheet'
+# (None en CSV), 'source' (bytes o ruta), 'mapping' y 'total_rows' (estimado, puede ser None).
+# precedence es la lista de compañías en orden de prioridad para resolver claves repetidas;
+# las tareas se ejecutan en ese orden. exports son los formatos columnares a generar además
+# de la base (ver exports.EXPORT_FORMATS); cada uno queda en un zip temporal descargable
+class IngestJob:
+    def __init__(self, tasks, db_path, db_mode, precedence=(), exports=()):
+        self.id = uuid.uuid4().hex
+        self.dedup = Deduplicator(precedence, os.path.join(tempfile.gettempdir(), f"conflictos_{self.id}.csv"))
+        self.tasks = self.dedup.sort_tasks(tasks)
+        self.db_path = db_path
+        self.db_mode = db_mode
+        self.status = 'pendiente'
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self.total_records = 0
+        self.total_inserted = 0
+        self.loader_counts = {}
+        self.current_task = None
+        # Métricas por etapa de cada tarea ya iniciada, en orden de ejecución
+        self.task_metrics = []
+        # Registros que no pasaron la validación, en un CSV temporal descargable
+        self.rejects = RejectsLog(os.path.join(tempfile.gettempdir(), f"rechazos_{self.id}.csv"))
+        self.exports = list(exports)
+        self.exporters = {}
+        # Zip de cada exportación terminada, por formato
+        self.export_files = {}
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()
+        # Misma forma que stats_by_file en la interfaz, con 'total_rows' para la barra de avance
+        self.stats_by_file = {}
+        for task in self.tasks:
+            entry = {'processed': 0, 'inserted': 0, 'validation': {}, 'dedup': {}, 'total_rows': task.get('total_rows')}
+            if task['kind'] == 'xlsx':
+                self.stats_by_file.setdefault(task['file'], {'sheets': {}})['sheets'][task['sheet']] = entry
+            else:
+                self.stats_by_file[task['file']] = entry
+
+    @property
+    def finished(self):
+        return self.status in ('completado', 'cancelado', 'error')
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def task_stats(self, task):
+        if task['kind'] == 'xlsx':
+            return self.stats_by_file[task['file']]['sheets'][task['sheet']]
+        return self.stats_by_file[task['file']]
+
+    # Fracción global de avance según las filas estimadas de cada tarea
+    def progress(self):
+        with self.lock:
+            total = sum(task.get('total_rows') or 0 for task in self.tasks)
+            done = sum(min(self.task_stats(task)['processed'], task.get('total_rows') or 0) for task in self.tasks)
+        if self.status == 'completado':
+            return 1.0
+        return done / total if total else 0.0
+
+    def run(self):
+        self.status = 'en_proceso'
+        self.started_at = time.time()
+        try:
+            if self.db_mode != 'incremental' and os.path.exists(self.db_path):
+                os.remove(self.db_path)
+                logging.info(f"Archivo existente {self.db_path} eliminado para nueva ejecución.")
+            self.exporters = open_exporters(self.exports, os.path.join(tempfile.gettempdir(), f"exportacion_{self.id}"))
+            # Una sola conexión para toda la ejecución; los insertados se cuentan con total_changes
+            with LOADERS[self.db_mode](self.db_path) as loader:
+                logging.info(f"Base de datos abierta: {self.db_path}")
+                for task in self.tasks:
+                    if self.cancel_event.is_set():
+                        break
+                    self.run_task(task, loader)
+                # El último commit se carga a la última tarea; al cerrar ya no queda nada pendiente
+                if self.task_metrics:
+                    with self.task_metrics[-1].measure('commit'):
+                        loader.commit()
+                self.loader_counts = {
+                    key: getattr(loader, key) for key in ('updated', 'unchanged', 'changes_logged') if hasattr(loader, key)
+                }
+            for fmt, exporter in self.exporters.items():
+                start = time.perf_counter()
+                exporter.close()
+                self.export_files[fmt] = exporter.archive(f"{exporter.directory}.zip")
+                if self.task_metrics:
+                    self.task_metrics[-1].add('export', time.perf_counter() - start)
+            self.status = 'cancelado' if self.cancel_event.is_set() else 'completado'
+            logging.info(f"Trabajo {self.id} {self.status}: {self.total_inserted} de {self.total_records} registros insertados.")
+        except Exception as e:
+            logging.exception(f"Error en el trabajo {self.id}")
+            self.error = str(e)
+            self.status = 'error'
+        finally:
+            # El contenido de los archivos ya no hace falta una vez terminado el trabajo
+            for task in self.tasks:
+                task['source'] = None
+            self.rejects.close()
+            self.dedup.close()
+            for exporter in self.exporters.values():
+                exporter.remove()
+            self.current_task = None
+            self.finished_at = time.time()
+            try:
+                write_metrics(self.task_metrics, self.id, self.db_path, self.db_mode)
+            except OSError as e:
+                logging.warning(f"No se pudieron escribir las métricas del trabajo {self.id}: {e}")
+
+    def run_task(self, task, loader):
+        self.current_task = task
+        metrics = TaskMetrics(task['file'], task['sheet'], task_bytes(task, task['source']))
+        self.task_metrics.append(metrics)
+        workbook = None
+        if task['kind'] == 'xlsx':
+            with metrics.measure('parse'):
+                workbook = open_workbook(task['source'])
+            batches = process_excel(workbook, task['mapping'], task['sheet'], batch_size=JOB_BATCH_SIZE)
+        else:
+            batches = process_csv(task['source'], task['mapping'], company_name=task_compania(task), batch_size=JOB_BATCH_SIZE)
+        stats = self.task_stats(task)
+        try:
+            for batch in metrics.timed_batches(batches):
+                if self.cancel_event.is_set():
+                    break
+                rejects = []
+                with metrics.measure('clean', len(batch)):
+                    rows, report = clean_batch(batch, rejects)
+                self.rejects.add(task['file'], task['sheet'], rejects)
+                inserted = load_batch(rows, report, stats, self.dedup, loader, self.exporters, metrics, self.lock)
+                with self.lock:
+                    self.total_records += len(rows)
+                    self.total_inserted += inserted
+        finally:
+            batches.close()
+            if workbook is not None:
+                workbook.close()
+        self.rejects.log_summary(task['file'], task['sheet'], stats['validation'])
+
+# Función para encolar un trabajo de ingesta; devuelve su id
+def submit_job(tasks, db_path, db_mode, precedence=(), exports=()):
+    job = IngestJob(tasks, db_path, db_mode, precedence, exports)
+    with _jobs_lock:
+        _jobs[job.id] = job
+        finished = [job_id for job_id, old_job in _jobs.items() if old_job.finished]
+        for job_id in finished[:max(0, len(finished) - JOB_HISTORY)]:
+            evicted = _jobs.pop(job_id)
+            for path in (evicted.rejects.path, evicted.dedup.conflicts_path, *evicted.export_files.values()):
+                if os.path.exists(path):
+                    os.remove(path)
+    _executor.submit(job.run)
+    logging.info(f"Trabajo {job.id} encolado con {len(tasks)} tareas hacia {db_path}")
+    return job.id
+
+# Función para obtener un trabajo por id (None si no existe o ya fue descartado)
+def get_job(job_id):
+    if job_id is None:
+        return None
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+# Función para obtener las rutas de origen que leen los trabajos aún no terminados
+def active_sources():
+    with _jobs_lock:
+        jobs = [job for job in _jobs.values() if not job.finished]
+    return {task['source'] for job in jobs for task in job.tasks if isinstance(task.get('source'), str)}
@@ -0,0 +1,234 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import unicodedata
+from datetime import datetime
+
+# Mapeos predeterminados basados en el nombre de la pestaña
+default_mappings = {
+    "SIMPATIC": {
+        'ICCID': 'ICCID',
+        'TELEFONO': 'MSISDN',
+        'ESTADO DEL SIM': 'Fecha Vencimiento',
+        'EN SESION': 'Fecha Vencimiento',
+        'ConsumoMb': 'Fecha Vencimiento'
+    },
+    "TELCEL ALEJANDRO": {
+        'ICCID': 'ICCID',
+        'TELEFONO': 'MSISDN',
+        'ESTADO DEL SIM': 'ESTADO SIM',
+        'EN SESION': 'SESIÓN',
+        'ConsumoMb': 'LÍMITE DE USO DE DATOS' 
+    },
+    "-1": {
+        'ICCID': 'ICCID',
+        'TELEFONO': 'MSISDN',
+        'ESTADO DEL SIM': 'Estado de SIM',
+        'EN SESION': 'En sesión',
+        'ConsumoMb': 'Uso de ciclo hasta la fecha (MB)'  
+    },
+    "-2": {
+        'ICCID': 'ICCID',
+        'TELEFONO': 'MSISDN',
+        'ESTADO DEL SIM': 'Estado de SIM',
+        'EN SESION': 'En sesión',
+        'ConsumoMb': 'Uso de ciclo hasta la fecha (MB)'  
+    },
+    "TELCEL": {
+        'ICCID': 'Cuenta Padre',
+        'TELEFONO': 'Línea',
+        'ESTADO DEL SIM': 'Estatus línea',
+        'EN SESION': 'Estatus línea',
+        'ConsumoMb': 'Motivo línea' 
+    },
+    "MOVISTAR": {
+        'ICCID': 'ICC',
+        'TELEFONO': 'MSISDN',
+        'ESTADO DEL SIM': 'Estado',
+        'EN SESION': 'Estado GPRS',
+        'ConsumoMb': 'Consumo Datos Mensual' 
+    },
+    "NANTI": {
+        'ICCID': 'ICCID',
+        'TELEFONO': 'MSISDN',
+        'ESTADO DEL SIM': 'Estado',
+        'EN SESION': 'Estado',
+        'ConsumoMb': 'Estado'
+    },
+    "LEGACY": {
+        'ICCID': 'ICCID',
+        'TELEFONO': 'normalized_key',
+        'ESTADO DEL SIM': 'ESTADO_DEL_SIM',
+        'EN SESION': 'EN_SESION',
+        'ConsumoMb': 'ConsumoMb'
+    }
+}
+
+# Nombres alternativos de columna por campo, además de los que aparecen en default_mappings.
+# Se comparan normalizados (sin acentos, mayúsculas ni espacios repetidos)
+HEADER_SYNONYMS = {
+    'ICCID': ['ICC', 'ICC ID', 'ICCID SIM', 'SIM ICCID', 'Número de SIM'],
+    'TELEFONO': ['Teléfono', 'Telefono', 'Número', 'Número de teléfono', 'Línea', 'MSISDN'],
+    'ESTADO DEL SIM': ['Estado del SIM', 'Estado SIM', 'Estado de SIM', 'Estatus SIM', 'Estatus', 'Status'],
+    'EN SESION': ['En sesión', 'Sesión', 'Estado de sesión', 'Estado GPRS', 'Session'],
+    'ConsumoMb': ['Consumo MB', 'Consumo (MB)', 'Consumo', 'Consumo Datos Mensual', 'Uso de datos (MB)', 'Uso de ciclo hasta la fecha (MB)'],
+}
+
+# Campos que deben resolverse para aplicar un mapeo sin intervención; ConsumoMb es opcional
+REQUIRED_FIELDS = ['ICCID', 'TELEFONO', 'ESTADO DEL SIM', 'EN SESION']
+
+# Archivo donde se guardan los mapeos confirmados manualmente, por firma de encabezado
+LEARNED_MAPPINGS_FILE = "mapeos_aprendidos.json"
+
+_learned_lock = threading.Lock()
+
+# Función para normalizar un encabezado: sin acentos, en minúsculas y con cualquier
+# separador (espacios, guiones bajos, puntuación) reducido a un espacio
+def normalize_header(value):
+    if value is None:
+        return ""
+    text = unicodedata.normalize('NFKD', str(value))
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return re.sub(r'[\W_]+', ' ', text.casefold()).strip()
+
+# Función para saber si un perfil usa una misma columna para varios campos (p. ej. 'Estado'
+# en NANTI o 'Fecha Vencimiento' en SIMPATIC): solo tiene sentido para la pestaña con su nombre
+def reuses_columns(mapping):
+    return len(set(mapping.values())) < len(mapping)
+
+# Índice de nombres normalizados por campo: primero los sinónimos, luego los nombres de
+# default_mappings en orden de perfil. Se omiten las columnas que un perfil usa para varios
+# campos (p. ej. 'Estado' en NANTI), que solo tienen sentido para ese perfil
+def build_header_index():
+    index = {}
+    for field, synonyms in HEADER_SYNONYMS.items():
+        profile_names = [
+            mapping[field] for mapping in default_mappings.values()
+            if list(mapping.values()).count(mapping[field]) == 1
+        ]
+        names = index.setdefault(field, [])
+        for name in synonyms + profile_names:
+            normalized = normalize_header(name)
+            if normalized not in names:
+                names.append(normalized)
+    return index
+
+HEADER_INDEX = build_header_index()
+
+# Función para ubicar cada encabezado normalizado en su primera posición
+def _header_positions(header_row):
+    positions = {}
+    for position, cell in enumerate(header_row):
+        positions.setdefault(normalize_header(cell), position)
+    positions.pop("", None)
+    return positions
+
+# Función para resolver un mapeo predeterminado contra una fila de encabezados, sin
+# distinguir acentos, mayúsculas ni espacios.
+# Devuelve las posiciones de columna por campo, o None si falta alguna columna.
+def resolve_default_mapping(profile_name, header_row):
+    mapping = default_mappings.get(profile_name)
+    if mapping is None:
+        return None
+    positions = _header_positions(header_row)
+    mapping_indices = {}
+    for key_field, column_name in mapping.items():
+        position = positions.get(normalize_header(column_name))
+        if position is None:
+            return None
+        mapping_indices[key_field] = position
+    return mapping_indices
+
+# Función para resolver campo por campo con el índice de sinónimos. Devuelve las posiciones
+# encontradas (puede ser un mapeo parcial, útil para preseleccionar la selección manual)
+def resolve_header_fields(header_row):
+    positions = _header_positions(header_row)
+    mapping_indices = {}
+    for field, names in HEADER_INDEX.items():
+        position = next((positions[name] for name in names if name in positions), None)
+        if position is not None:
+            mapping_indices[field] = position
+    return mapping_indices
+
+# Función para obtener la firma de un encabezado (hash de sus nombres normalizados, en orden)
+def header_signature(header_row):
+    normalized = '\x1f'.join(normalize_header(cell) for cell in header_row)
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=12).hexdigest()
+
+# Función para cargar los mapeos aprendidos ({firma: {'header', 'mapping', 'saved_at'}})
+def load_learned_mappings(path=LEARNED_MAPPINGS_FILE):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logging.warning(f"No se pudieron leer los mapeos aprendidos de {path}: {e}")
+        return {}
+
+# Función para escribir el archivo de mapeos aprendidos de forma atómica
+def _write_learned_mappings(learned, path):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.mapeos_', suffix='.json')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(learned, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+# Función para guardar los campos confirmados manualmente para un encabezado. Puede ser un
+# mapeo parcial: se suma a los campos ya guardados y el resto se resuelve por sinónimos
+def save_learned_mapping(header_row, mapping_indices, path=LEARNED_MAPPINGS_FILE):
+    with _learned_lock:
+        learned = load_learned_mappings(path)
+        previous = learned.get(header_signature(header_row), {}).get('mapping', {})
+        mapping_indices = {**previous, **mapping_indices}
+        learned[header_signature(header_row)] = {
+            'header': ["" if cell is None else str(cell) for cell in header_row],
+            'mapping': mapping_indices,
+            'saved_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        _write_learned_mappings(learned, path)
+    logging.info(f"Mapeo guardado para el encabezado {header_signature(header_row)}: {mapping_indices}")
+
+# Función para olvidar el mapeo guardado de un encabezado
+def forget_learned_mapping(header_row, path=LEARNED_MAPPINGS_FILE):
+    with _learned_lock:
+        learned = load_learned_mappings(path)
+        if learned.pop(header_signature(header_row), None) is not None:
+            _write_learned_mappings(learned, path)
+
+# Función para obtener el mapeo guardado de un encabezado, quizá parcial (None si no hay)
+def find_learned_mapping(header_row, path=LEARNED_MAPPINGS_FILE):
+    entry = load_learned_mappings(path).get(header_signature(header_row))
+    return entry['mapping'] if entry else None
+
+# Función para encontrar el mapeo aplicable a una pestaña o CSV, en este orden: el mapeo
+# guardado para su encabezado (completado con sinónimos si es parcial), el perfil con su nombre, el primer perfil cuyas columnas
+# estén todas en el encabezado (sin los que repiten una columna en varios campos) y, por
+# último, la resolución campo por campo con sinónimos.
+# Devuelve (origen del mapeo, posiciones) o (None, None); el origen es el nombre del perfil,
+# o el nombre recibido si el mapeo es guardado o por sinónimos.
+def find_default_mapping(name, header_row, learned_path=LEARNED_MAPPINGS_FILE):
+    learned = find_learned_mapping(header_row, learned_path)
+    if learned is not None:
+        mapping_indices = {**resolve_header_fields(header_row), **learned}
+        if all(field in mapping_indices for field in REQUIRED_FIELDS):
+            mapping_indices.setdefault('ConsumoMb', -1)
+            return name, mapping_indices
+    mapping_indices = resolve_default_mapping(name, header_row)
+    if mapping_indices is not None:
+        return name, mapping_indices
+    for profile_name, mapping in default_mappings.items():
+        if reuses_columns(mapping):
+            continue
+        mapping_indices = resolve_default_mapping(profile_name, header_row)
+        if mapping_indices is not None:
+            return profile_name, mapping_indices
+    mapping_indices = resolve_header_fields(header_row)
+    if all(field in mapping_indices for field in REQUIRED_FIELDS):
+        mapping_indices.setdefault('ConsumoMb', -1)
+        return name, mapping_indices
+    return None, None
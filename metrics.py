@@ -0,0 +1,121 @@
+# Instrumentación por etapa de la ingesta (parse, extract, clean, dedup, insert, commit, export) para cada
+# archivo y pestaña: tiempo, filas/s, bytes leídos y crecimiento de la memoria residente durante la tarea.
+# Los registros se muestran en la pestaña "Estadísticas" y se agregan como líneas JSON a
+# METRICS_LOG, para distinguir si un día lento vino de openpyxl, de la limpieza o de SQLite.
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+STAGES = ('parse', 'extract', 'clean', 'dedup', 'insert', 'commit', 'export')
+
+# Archivo de métricas estructuradas, una línea JSON por etapa de cada archivo/pestaña
+METRICS_LOG = "procesamiento_metricas.jsonl"
+
+# Función para obtener la memoria residente actual del proceso en MB. Se lee /proc/self/statm
+# (Linux); en otros sistemas devuelve None y no se reporta memoria. No se usa el pico de
+# getrusage porque es el de toda la vida del proceso, igual para todas las tareas del servidor
+def current_memory_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+# Función para obtener el tamaño de un origen (bytes o ruta); 0 si no se conoce
+def source_size(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return len(source)
+    try:
+        return os.path.getsize(source)
+    except (OSError, TypeError):
+        return 0
+
+# Función para obtener los bytes que lee una tarea: en Excel, el tamaño comprimido de su hoja
+# ('sheet_bytes', de probe_workbook) en lugar del libro entero; en CSV, el archivo
+def task_bytes(task, source):
+    if task['kind'] == 'xlsx' and task.get('sheet_bytes') is not None:
+        return task['sheet_bytes']
+    return source_size(source)
+
+# Tiempos y filas por etapa de una tarea (una pestaña de Excel o un CSV). La memoria de cada
+# etapa es el mayor crecimiento de la memoria residente respecto del inicio de la tarea,
+# medido al terminar cada paso de la etapa
+class TaskMetrics:
+    def __init__(self, file, sheet=None, bytes_read=0):
+        self.file = file
+        self.sheet = sheet
+        self.bytes_read = bytes_read
+        self.stages = {}
+        self.memory_start_mb = current_memory_mb()
+
+    def _add(self, stage, seconds, rows, memory_growth_mb):
+        totals = self.stages.setdefault(stage, {'seconds': 0.0, 'rows': 0, 'memory_growth_mb': None})
+        totals['seconds'] += seconds
+        totals['rows'] += rows
+        if memory_growth_mb is not None:
+            totals['memory_growth_mb'] = max(totals['memory_growth_mb'] or 0.0, memory_growth_mb)
+
+    def add(self, stage, seconds, rows=0):
+        current = current_memory_mb()
+        growth = None
+        if current is not None and self.memory_start_mb is not None:
+            growth = max(current - self.memory_start_mb, 0.0)
+        self._add(stage, seconds, rows, growth)
+
+    @contextmanager
+    def measure(self, stage, rows=0):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start, rows)
+
+    # Recorre un generador de lotes cargando a 'stage' el tiempo de producir cada lote
+    def timed_batches(self, batches, stage='extract'):
+        while True:
+            start = time.perf_counter()
+            batch = next(batches, None)
+            if batch is None:
+                self.add(stage, time.perf_counter() - start)
+                return
+            self.add(stage, time.perf_counter() - start, len(batch))
+            yield batch
+
+    # Suma las etapas medidas en otro proceso (p. ej. la extracción del modo por lotes),
+    # conservando la memoria medida allí
+    def merge(self, other):
+        for stage, totals in other.stages.items():
+            self._add(stage, totals['seconds'], totals['rows'], totals.get('memory_growth_mb'))
+        self.bytes_read = max(self.bytes_read, other.bytes_read)
+
+    # Un registro por etapa medida, en el orden de STAGES
+    def records(self):
+        records = []
+        for stage in STAGES:
+            if stage not in self.stages:
+                continue
+            totals = self.stages[stage]
+            memory = totals['memory_growth_mb']
+            records.append({
+                'file': self.file,
+                'sheet': self.sheet,
+                'stage': stage,
+                'seconds': round(totals['seconds'], 6),
+                'rows': totals['rows'],
+                'rows_per_second': round(totals['rows'] / totals['seconds'], 1) if totals['seconds'] and totals['rows'] else None,
+                'bytes_read': self.bytes_read,
+                'memory_growth_mb': round(memory, 1) if memory is not None else None,
+            })
+        return records
+
+# Función para agregar los registros de una ejecución a METRICS_LOG como líneas JSON
+def write_metrics(task_metrics, run_id, db_path, db_mode, path=METRICS_LOG):
+    timestamp = datetime.now().isoformat(timespec='seconds')
+    with open(path, 'a', encoding='utf-8') as f:
+        for metrics in task_metrics:
+            for record in metrics.records():
+                line = {'timestamp': timestamp, 'run_id': run_id, 'db_path': db_path, 'db_mode': db_mode, **record}
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
@@ -0,0 +1,90 @@
+import os
+import sqlite3
+
+import streamlit as st
+
+from analysis import (
+    TOP_CONSUMERS_LIMIT, db_signature, load_cube, lookup,
+    summary_by_compania, summary_by_state, top_consumers
+)
+from database import PERSISTENT_DB_FILENAME
+from jobs import get_job
+from snapshot_diff import list_snapshots
+
+# Agregados en caché por base y firma del archivo: se recalculan solo si la base cambió
+@st.cache_data(max_entries=8, show_spinner=False)
+def cached_cube(db_path, signature):
+    return load_cube(db_path)
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def cached_top_consumers(db_path, signature):
+    return top_consumers(db_path, TOP_CONSUMERS_LIMIT)
+
+st.title("Análisis de la Base de Datos")
+
+# Bases disponibles: la del último trabajo de esta sesión primero, luego los snapshots
+# diarios (más recientes primero) y el almacén incremental
+job = get_job(st.session_state.get('job_id'))
+# Las rutas se comparan absolutas: list_snapshots() las devuelve con './' y el trabajo sin él
+candidates = {}
+if job is not None and job.finished and job.status != 'error':
+    candidates[os.path.abspath(job.db_path)] = job.db_path
+for path in [*reversed(list_snapshots()), PERSISTENT_DB_FILENAME]:
+    candidates.setdefault(os.path.abspath(path), path)
+candidates = [path for path in candidates.values() if os.path.exists(path)]
+
+if not candidates:
+    st.info("Todavía no hay bases generadas. Procesa archivos en la página principal.")
+    st.stop()
+
+db_path = st.selectbox("Base de datos:", candidates, format_func=os.path.basename, key="analysis_db")
+if job is not None and not job.finished and os.path.abspath(job.db_path) == os.path.abspath(db_path):
+    st.info("Esta base se está generando; el análisis estará disponible al terminar el procesamiento.")
+    st.stop()
+
+try:
+    signature = db_signature(db_path)
+    with st.spinner("Calculando agregados..."):
+        cube = cached_cube(db_path, signature)
+except sqlite3.Error as e:
+    st.error(f"No se pudo leer la base {os.path.basename(db_path)}: {e}")
+    st.stop()
+
+# Totales generales
+col1, col2, col3, col4 = st.columns(4)
+with col1:
+    st.metric("SIMs", f"{int(cube['SIMs'].sum()):,}")
+with col2:
+    st.metric("Activas", f"{int(cube.loc[cube['activa'], 'SIMs'].sum()):,}")
+with col3:
+    st.metric("En sesión", f"{int(cube.loc[cube['en_sesion'], 'SIMs'].sum()):,}")
+with col4:
+    st.metric("ConsumoMb total", f"{cube['ConsumoMb'].sum():,.2f}")
+
+tab1, tab2, tab3, tab4 = st.tabs(["Por Compañía", "Por Estado", "Mayores Consumos", "Búsqueda"])
+
+with tab1:
+    by_compania = summary_by_compania(cube)
+    st.dataframe(by_compania)
+    st.bar_chart(by_compania[['Activas', 'En sesión']])
+
+with tab2:
+    st.dataframe(summary_by_state(cube))
+
+with tab3:
+    top_n = st.slider("Cantidad de SIMs:", min_value=5, max_value=TOP_CONSUMERS_LIMIT, value=20, step=5, key="analysis_top")
+    st.dataframe(cached_top_consumers(db_path, signature).head(top_n), hide_index=True)
+
+with tab4:
+    column = st.radio("Buscar por:", ["ICCID", "TELEFONO"], format_func={'ICCID': "ICCID", 'TELEFONO': "Teléfono"}.get,
+                      key="analysis_lookup_column", horizontal=True)
+    value = st.text_input("Valor a buscar:", key="analysis_lookup_value")
+    if value.strip():
+        result, changes = lookup(db_path, column, value)
+        if result.empty:
+            st.write("Sin resultados.")
+        else:
+            st.dataframe(result, hide_index=True)
+        if changes is not None and not changes.empty:
+            st.subheader("Cambios registrados")
+            st.dataframe(changes, hide_index=True)
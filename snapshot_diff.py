@@ -0,0 +1,185 @@
+# Comparación entre dos snapshots "dei Sims (<fecha>).db": SIMs agregadas, eliminadas y
+# cambiadas (estado, sesión o compañía) por Compania. Una SIM es un par (ICCID, TELEFONO),
+# la misma clave de la tabla sims: varias SIMs pueden compartir ICCID (p. ej. TELCEL mapea
+# el ICCID a la cuenta padre), y un cambio de teléfono aparece como eliminada y agregada.
+#
+# Uso: python snapshot_diff.py <anterior.db> <nuevo.db> <salida.csv|salida.parquet> [--format csv|parquet]
+#
+# Ambos snapshots se adjuntan en solo lectura; cada uno se copia a una tabla temporal
+# WITHOUT ROWID agrupada por (ICCID, TELEFONO), de modo que los joins recorren índices
+# ordenados y el resultado se escribe por bloques sin cargar las tablas en pandas. Las
+# claves ya llegan limpias (solo dígitos) desde la ingesta, así que se comparan tal cual.
+import argparse
+import csv
+import glob
+import logging
+import os
+import sqlite3
+import sys
+from pathlib import Path
+
+# Filas por bloque al escribir el resultado
+DIFF_CHUNK_ROWS = 50_000
+
+DIFF_COLUMNS = [
+    'tipo', 'ICCID', 'TELEFONO',
+    'Compania_anterior', 'Compania_nueva',
+    'ESTADO_DEL_SIM_anterior', 'ESTADO_DEL_SIM_nuevo',
+    'EN_SESION_anterior', 'EN_SESION_nuevo',
+]
+
+# Condición de "cambiada" entre la fila anterior (o) y la nueva (n)
+CHANGED_CONDITION = '''
+    n.Compania IS NOT o.Compania OR n.ESTADO_DEL_SIM IS NOT o.ESTADO_DEL_SIM OR n.EN_SESION IS NOT o.EN_SESION
+'''
+
+# Misma SIM en ambos snapshots
+SAME_KEY = 'o.ICCID = n.ICCID AND o.TELEFONO = n.TELEFONO'
+
+DIFF_SQL = f'''
+    SELECT 'agregada', n.ICCID, n.TELEFONO, NULL, n.Compania, NULL, n.ESTADO_DEL_SIM, NULL, n.EN_SESION
+    FROM snap_new n WHERE NOT EXISTS (SELECT 1 FROM snap_old o WHERE {SAME_KEY})
+    UNION ALL
+    SELECT 'eliminada', o.ICCID, o.TELEFONO, o.Compania, NULL, o.ESTADO_DEL_SIM, NULL, o.EN_SESION, NULL
+    FROM snap_old o WHERE NOT EXISTS (SELECT 1 FROM snap_new n WHERE {SAME_KEY})
+    UNION ALL
+    SELECT 'cambiada', n.ICCID, n.TELEFONO, o.Compania, n.Compania,
+           o.ESTADO_DEL_SIM, n.ESTADO_DEL_SIM, o.EN_SESION, n.EN_SESION
+    FROM snap_new n JOIN snap_old o ON {SAME_KEY}
+    WHERE {CHANGED_CONDITION}
+'''
+
+SUMMARY_SQL = f'''
+    SELECT Compania, SUM(agregadas), SUM(eliminadas), SUM(cambiadas), SUM(cambio_estado), SUM(cambio_compania)
+    FROM (
+        SELECT n.Compania AS Compania, 1 AS agregadas, 0 AS eliminadas, 0 AS cambiadas, 0 AS cambio_estado, 0 AS cambio_compania
+        FROM snap_new n WHERE NOT EXISTS (SELECT 1 FROM snap_old o WHERE {SAME_KEY})
+        UNION ALL
+        SELECT o.Compania, 0, 1, 0, 0, 0
+        FROM snap_old o WHERE NOT EXISTS (SELECT 1 FROM snap_new n WHERE {SAME_KEY})
+        UNION ALL
+        SELECT n.Compania, 0, 0, 1, n.ESTADO_DEL_SIM IS NOT o.ESTADO_DEL_SIM, n.Compania IS NOT o.Compania
+        FROM snap_new n JOIN snap_old o ON {SAME_KEY}
+        WHERE {CHANGED_CONDITION}
+    )
+    GROUP BY Compania
+    ORDER BY Compania
+'''
+
+# Función para listar los snapshots diarios disponibles en un directorio (más recientes al final)
+def list_snapshots(directory='.'):
+    return sorted(glob.glob(os.path.join(glob.escape(directory), 'dei Sims (*).db')))
+
+# Función para abrir una conexión con ambos snapshots adjuntos y las tablas temporales listas
+def open_snapshot_pair(old_db, new_db):
+    conn = sqlite3.connect('')
+    conn.execute("PRAGMA cache_size = -262144")
+    for alias, path in (('old', old_db), ('new', new_db)):
+        uri = Path(path).resolve().as_uri() + '?mode=ro'
+        conn.execute(f"ATTACH DATABASE ? AS {alias}_db", (uri,))
+        conn.execute(f'''
+            CREATE TEMP TABLE snap_{alias} (
+                ICCID TEXT NOT NULL,
+                TELEFONO TEXT NOT NULL,
+                ESTADO_DEL_SIM TEXT,
+                EN_SESION TEXT,
+                Compania TEXT,
+                PRIMARY KEY (ICCID, TELEFONO)
+            ) WITHOUT ROWID
+        ''')
+        # (ICCID, TELEFONO) es único en la tabla sims; si una base vieja repite alguna clave
+        # se conserva una sola fila y se avisa cuántas se descartaron
+        copied = conn.execute(f'''
+            INSERT OR IGNORE INTO snap_{alias}
+            SELECT CAST(ICCID AS TEXT), CAST(coalesce(TELEFONO, '') AS TEXT), lower(trim(ESTADO_DEL_SIM)), lower(trim(EN_SESION)), Compania
+            FROM {alias}_db.sims
+            WHERE ICCID IS NOT NULL AND ICCID <> ''
+        ''').rowcount
+        total = conn.execute(f"SELECT COUNT(*) FROM {alias}_db.sims WHERE ICCID IS NOT NULL AND ICCID <> ''").fetchone()[0]
+        if total > copied:
+            logging.warning(f"{path}: {total - copied} filas con (ICCID, TELEFONO) repetido no se comparan")
+    conn.commit()
+    return conn
+
+# Función para obtener el resumen por Compania de un par de snapshots ya abierto
+def summarize_diff(conn):
+    summary = {}
+    for compania, agregadas, eliminadas, cambiadas, cambio_estado, cambio_compania in conn.execute(SUMMARY_SQL):
+        summary[compania] = {
+            'agregadas': agregadas,
+            'eliminadas': eliminadas,
+            'cambiadas': cambiadas,
+            'cambio_estado': cambio_estado,
+            'cambio_compania': cambio_compania,
+        }
+    return summary
+
+# Función para escribir el detalle de diferencias en CSV, por bloques
+def write_diff_csv(cursor, output_path, chunk_rows=DIFF_CHUNK_ROWS):
+    rows_written = 0
+    with open(output_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(DIFF_COLUMNS)
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            writer.writerows(rows)
+            rows_written += len(rows)
+    return rows_written
+
+# Función para escribir el detalle de diferencias en Parquet, un row group por bloque
+def write_diff_parquet(cursor, output_path, chunk_rows=DIFF_CHUNK_ROWS):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("Se requiere pyarrow para exportar a Parquet") from e
+    schema = pa.schema([(column, pa.string()) for column in DIFF_COLUMNS])
+    rows_written = 0
+    with pq.ParquetWriter(output_path, schema) as writer:
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            columns = list(zip(*rows))
+            writer.write_table(pa.Table.from_arrays([pa.array(column, type=pa.string()) for column in columns], schema=schema))
+            rows_written += len(rows)
+    return rows_written
+
+# Función principal: compara dos snapshots, escribe el detalle y devuelve el resumen por Compania
+def diff_snapshots(old_db, new_db, output_path, fmt='csv', chunk_rows=DIFF_CHUNK_ROWS):
+    if fmt not in ('csv', 'parquet'):
+        raise ValueError(f"Formato no soportado: {fmt}")
+    conn = open_snapshot_pair(old_db, new_db)
+    try:
+        summary = summarize_diff(conn)
+        cursor = conn.execute(DIFF_SQL)
+        if fmt == 'parquet':
+            rows_written = write_diff_parquet(cursor, output_path, chunk_rows)
+        else:
+            rows_written = write_diff_csv(cursor, output_path, chunk_rows)
+        logging.info(f"Diferencias entre {old_db} y {new_db}: {rows_written} filas escritas en {output_path}")
+        return summary
+    finally:
+        conn.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compara dos snapshots 'dei Sims' y exporta las diferencias.")
+    parser.add_argument('old_db', help="Snapshot anterior")
+    parser.add_argument('new_db', help="Snapshot nuevo")
+    parser.add_argument('output', help="Archivo de salida")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default=None,
+                        help="Formato de salida (por defecto, según la extensión del archivo)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    fmt = args.format or ('parquet' if args.output.endswith('.parquet') else 'csv')
+    summary = diff_snapshots(args.old_db, args.new_db, args.output, fmt=fmt)
+    for compania, counts in summary.items():
+        print(f"{compania}: {counts['agregadas']} agregadas, {counts['eliminadas']} eliminadas, "
+              f"{counts['cambiadas']} cambiadas ({counts['cambio_estado']} de estado, {counts['cambio_compania']} de compañía)")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
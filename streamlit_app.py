@@ -1,469 +1,580 @@
-import openpyxl 
 import pandas as pd
-import sqlite3
-import re
+import glob
 import os
 import streamlit as st
 import logging
-from io import BytesIO
-from datetime import date
+import hashlib
+import shutil
+import threading
+import tempfile
+import time
+import uuid
+from collections import OrderedDict
+from extraction import probe_workbook
+from database import default_output_filename, PERSISTENT_DB_FILENAME
+from mappings import (
+    default_mappings, find_default_mapping, find_learned_mapping, resolve_header_fields, header_signature,
+    load_learned_mappings, save_learned_mapping, forget_learned_mapping
+)
+from jobs import active_sources, submit_job, get_job
+from exports import EXPORT_FORMATS
+from metrics import STAGES
+from ingest_logging import configure_logging
+from snapshot_diff import diff_snapshots, list_snapshots
 
-# Configuración básica de logging
-logging.basicConfig(level=logging.INFO, filename='procesamiento.log', filemode='w',
-                    format='%(asctime)s - %(levelname)s - %(message)s')
+# Configuración de logging: un hilo aparte escribe el archivo a partir de una cola
+configure_logging(filename='procesamiento.log', filemode='w')
 
 # Nombre del archivo de salida con la fecha de hoy
-output_filename = f"dei Sims ({date.today().strftime('%Y-%m-%d')}).db"
-
-# Mapeos predeterminados basados en el nombre de la pestaña
-default_mappings = {
-    "SIMPATIC": {
-        'ICCID': 'ICCID',
-        'TELEFONO': 'MSISDN',
-        'ESTADO DEL SIM': 'Fecha Vencimiento',
-        'EN SESION': 'Fecha Vencimiento',
-        'ConsumoMb': 'Fecha Vencimiento'
-    },
-    "TELCEL ALEJANDRO": {
-        'ICCID': 'ICCID',
-        'TELEFONO': 'MSISDN',
-        'ESTADO DEL SIM': 'ESTADO SIM',
-        'EN SESION': 'SESIÓN',
-        'ConsumoMb': 'LÍMITE DE USO DE DATOS' 
-    },
-    "-1": {
-        'ICCID': 'ICCID',
-        'TELEFONO': 'MSISDN',
-        'ESTADO DEL SIM': 'Estado de SIM',
-        'EN SESION': 'En sesión',
-        'ConsumoMb': 'Uso de ciclo hasta la fecha (MB)'  
-    },
-    "-2": {
-        'ICCID': 'ICCID',
-        'TELEFONO': 'MSISDN',
-        'ESTADO DEL SIM': 'Estado de SIM',
-        'EN SESION': 'En sesión',
-        'ConsumoMb': 'Uso de ciclo hasta la fecha (MB)'  
-    },
-    "TELCEL": {
-        'ICCID': 'Cuenta Padre',
-        'TELEFONO': 'Línea',
-        'ESTADO DEL SIM': 'Estatus línea',
-        'EN SESION': 'Estatus línea',
-        'ConsumoMb': 'Motivo línea' 
-    },
-    "MOVISTAR": {
-        'ICCID': 'ICC',
-        'TELEFONO': 'MSISDN',
-        'ESTADO DEL SIM': 'Estado',
-        'EN SESION': 'Estado GPRS',
-        'ConsumoMb': 'Consumo Datos Mensual' 
-    },
-    "NANTI": {
-        'ICCID': 'ICCID',
-        'TELEFONO': 'MSISDN',
-        'ESTADO DEL SIM': 'Estado',
-        'EN SESION': 'Estado',
-        'ConsumoMb': 'Estado'
-    },
-    "LEGACY": {
-        'ICCID': 'ICCID',
-        'TELEFONO': 'normalized_key',
-        'ESTADO DEL SIM': 'ESTADO_DEL_SIM',
-        'EN SESION': 'EN_SESION',
-        'ConsumoMb': 'ConsumoMb'
-    }
-}
-
-def create_database(db_path):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute(''' 
-        CREATE TABLE IF NOT EXISTS sims ( 
-            ICCID TEXT, 
-            TELEFONO TEXT, 
-            ESTADO_DEL_SIM TEXT, 
-            EN_SESION TEXT, 
-            ConsumoMb TEXT,
-            Compania TEXT,
-            UNIQUE(ICCID, TELEFONO)
-        ) 
-    ''')
-    conn.commit()
-    conn.close()
-
-# Función para insertar datos en la base de datos con manejo de duplicados
-def insert_data(db_path, data):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    records_before = cursor.execute("SELECT COUNT(*) FROM sims").fetchone()[0]
-    try:
-        cursor.executemany(
-            "INSERT OR IGNORE INTO sims (ICCID, TELEFONO, ESTADO_DEL_SIM, EN_SESION, ConsumoMb, Compania) VALUES (?, ?, ?, ?, ?, ?)",
-            data
-        )
-        conn.commit()
-        records_after = cursor.execute("SELECT COUNT(*) FROM sims").fetchone()[0]
-        records_inserted = records_after - records_before
-        logging.info(f"Insertados {records_inserted} registros en la base de datos.")
-        return len(data), records_inserted
-    finally:
-        conn.close()
-
-# Función para limpiar ICCID, TELEFONO y ConsumoMb manteniendo ceros a la izquierda
-def clean_iccid_telefono_consumo(data):
-    cleaned_data = []
-    for row in data:
-        cleaned_row = list(row)
-        original_iccid = cleaned_row[0]
-        original_telefono = cleaned_row[1]
-        original_consumo_mb = cleaned_row[4]
-        
-        # Limpieza de ICCID
-        iccid_value = row[0]
-        if isinstance(iccid_value, float) and iccid_value.is_integer():
-            cleaned_iccid = str(int(iccid_value))
-        else:
-            cleaned_iccid = str(iccid_value)
-        cleaned_row[0] = ''.join(filter(str.isdigit, cleaned_iccid)) if cleaned_iccid else ""
-        
-        # Limpieza de TELEFONO
-        telefono_value = row[1]
-        if isinstance(telefono_value, float) and telefono_value.is_integer():
-            cleaned_telefono = str(int(telefono_value))
-        else:
-            cleaned_telefono = str(telefono_value)
-        cleaned_row[1] = ''.join(filter(str.isdigit, cleaned_telefono)) if cleaned_telefono else ""
-        
-        # Limpieza de ConsumoMb
-        consumo_mb_value = row[4]
-        cleaned_consumo_mb = ''.join(filter(str.isdigit, consumo_mb_value)) if consumo_mb_value else ""
-        cleaned_row[4] = cleaned_consumo_mb
-        
-        # Normalizar otros campos
-        cleaned_row[2] = cleaned_row[2].strip().lower() if cleaned_row[2] else ""
-        cleaned_row[3] = cleaned_row[3].strip().lower() if cleaned_row[3] else ""
-        
-        cleaned_data.append(tuple(cleaned_row))
-        logging.info(f"Limpieza Registro: ICCID '{original_iccid}' a '{cleaned_row[0]}', TELEFONO '{original_telefono}' a '{cleaned_row[1]}', ConsumoMb '{original_consumo_mb}' a '{cleaned_row[4]}'")
-    return cleaned_data
-
-# Función para normalizar otros campos
-def normalize_data(data):
-    normalized_data = []
-    for row in data:
-        cleaned_row = list(row)
-        cleaned_row[2] = cleaned_row[2].strip().lower() if cleaned_row[2] else ""
-        cleaned_row[3] = cleaned_row[3].strip().lower() if cleaned_row[3] else ""
-        normalized_data.append(tuple(cleaned_row))
-    return normalized_data
-
-# Función para procesar archivos Excel (usando file bytes)
-def process_excel(file_bytes, column_mapping, sheet_name):
-    workbook = openpyxl.load_workbook(BytesIO(file_bytes), data_only=True)
-    sheet = workbook[sheet_name]
-    all_data = []
-    header_row = next(sheet.iter_rows(min_row=1, max_row=1, values_only=True))
-    for row in sheet.iter_rows(min_row=2, values_only=True):
-        try:
-            row_data = []
-            for key in ['ICCID', 'TELEFONO', 'ESTADO DEL SIM', 'EN SESION', 'ConsumoMb']:
-                col_index = column_mapping[key]
-                if col_index is None or col_index == -1:
-                    cell_value = ""
-                elif col_index >= len(row):
-                    cell_value = ""
-                else:
-                    cell = row[col_index]
-                    if isinstance(cell, float) and cell.is_integer():
-                        cell_value = str(int(cell))
-                    elif isinstance(cell, (int, str)):
-                        cell_value = str(cell)
-                    else:
-                        cell_value = str(cell) if cell is not None else ""
-                row_data.append(cell_value)
-            row_data.append(sheet_name)  # Añadir el nombre de la pestaña como 'Compania'
-            all_data.append(row_data)
-        except IndexError:
-            st.warning(f"Error procesando fila en la pestaña '{sheet_name}'. Fila omitida.")
-    return all_data
-
-# Función para procesar archivos CSV (usando file bytes)
-def process_csv(file_bytes, column_mapping):
-    try:
-        df = pd.read_csv(BytesIO(file_bytes), dtype=str)
-    except Exception as e:
-        logging.error(f"Error leyendo CSV: {e}")
-        return []
-    all_data = []
-    company_name = "CSV"  # Se puede ajustar si se desea usar otro identificador
-    for index, row in df.iterrows():
+output_filename = default_output_filename()
+
+# Tamaño de los bloques con que se copian los archivos subidos al disco
+SPOOL_CHUNK_BYTES = 8 * 1024 * 1024
+
+# Directorios temporales de sesión: se borran tras SPOOL_MAX_IDLE_SECONDS sin uso, revisando
+# como mucho una vez cada SPOOL_SWEEP_INTERVAL_SECONDS
+SPOOL_DIR_PREFIX = 'sims_uploads_'
+SPOOL_MAX_IDLE_SECONDS = 6 * 3600
+SPOOL_SWEEP_INTERVAL_SECONDS = 600
+
+# Campos de la selección manual y sufijo de la clave de cada widget
+MANUAL_FIELDS = [
+    ('ICCID', 'iccid'),
+    ('TELEFONO', 'telefono'),
+    ('ESTADO DEL SIM', 'estado_sim'),
+    ('EN SESION', 'en_sesion'),
+    ('ConsumoMb', 'consumo_mb'),
+]
+
+# Número máximo de libros cuyos metadatos (pestañas, encabezados, max_column) se mantienen en caché
+WORKBOOK_CACHE_MAX_ENTRIES = 64
+
+# Caché de libros parseados compartida entre reruns y sesiones (LRU acotada por número de libros)
+@st.cache_resource
+def get_workbook_cache():
+    return {'entries': OrderedDict(), 'lock': threading.Lock()}
+
+# Función para copiar un archivo subido, una sola vez por sesión, al directorio temporal de la
+# sesión. La copia se hace por bloques, calculando a la vez el hash del contenido y el número
+# de líneas; a partir de ahí los parsers trabajan sobre la ruta y no sobre copias en memoria.
+# Devuelve {'path', 'hash', 'lines'}
+def spool_upload(file):
+    spooled = st.session_state.setdefault('_spooled_uploads', {})
+    file_key = getattr(file, 'file_id', None) or file.name
+    # Si la limpieza periódica borró la copia (sesión inactiva), se vuelve a copiar
+    if file_key not in spooled or not os.path.exists(spooled[file_key]['path']):
+        if not os.path.isdir(st.session_state.get('_spool_dir', '')):
+            st.session_state['_spool_dir'] = tempfile.mkdtemp(prefix=SPOOL_DIR_PREFIX)
+        path = os.path.join(st.session_state['_spool_dir'], f"{uuid.uuid4().hex[:8]}_{file.name}")
+        digest = hashlib.blake2b(digest_size=16)
+        lines = 0
+        file.seek(0)
+        with open(path, 'wb') as f:
+            while chunk := file.read(SPOOL_CHUNK_BYTES):
+                digest.update(chunk)
+                lines += chunk.count(b'\n')
+                f.write(chunk)
+        file.seek(0)
+        spooled[file_key] = {'path': path, 'hash': digest.hexdigest(), 'lines': lines}
+        logging.info(f"Archivo {file.name} copiado a {path}")
+    return spooled[file_key]
+
+# Función para borrar del disco los archivos que ya no están en el cargador
+def prune_spooled_uploads(uploaded_files):
+    spooled = st.session_state.get('_spooled_uploads', {})
+    current = {getattr(file, 'file_id', None) or file.name for file in uploaded_files}
+    for file_key in [key for key in spooled if key not in current]:
+        entry = spooled.pop(file_key)
+        if os.path.exists(entry['path']):
+            os.remove(entry['path'])
+
+# Estado compartido entre sesiones de la limpieza de directorios temporales
+@st.cache_resource
+def get_spool_sweeper():
+    return {'last_sweep': 0.0, 'lock': threading.Lock()}
+
+# Función para borrar los directorios temporales de sesiones que ya no se usan. Streamlit no
+# avisa cuando una sesión termina, así que cada rerun marca como usado el directorio propio y,
+# cada SPOOL_SWEEP_INTERVAL_SECONDS, se borran los inactivos que ningún trabajo esté leyendo
+def sweep_spool_dirs():
+    own_dir = st.session_state.get('_spool_dir')
+    if own_dir and os.path.isdir(own_dir):
+        os.utime(own_dir)
+    sweeper = get_spool_sweeper()
+    now = time.time()
+    with sweeper['lock']:
+        if now - sweeper['last_sweep'] < SPOOL_SWEEP_INTERVAL_SECONDS:
+            return
+        sweeper['last_sweep'] = now
+    in_use = {os.path.dirname(path) for path in active_sources()}
+    for path in glob.glob(os.path.join(glob.escape(tempfile.gettempdir()), SPOOL_DIR_PREFIX + '*')):
         try:
-            row_data = []
-            for key in ['ICCID', 'TELEFONO', 'ESTADO DEL SIM', 'EN SESION', 'ConsumoMb']:
-                cell = row.get(column_mapping[key], "")
-                if pd.notnull(cell):
-                    cell = cell.strip()
-                    if re.match(r'^\d+\.\0+$', cell):
-                        cell_value = str(int(float(cell)))
-                    else:
-                        cell_value = re.sub(r'[^\d]', '', cell)
-                else:
-                    cell_value = ""
-                row_data.append(cell_value)
-            row_data.append(company_name)
-            all_data.append(row_data)
-        except KeyError:
-            st.warning(f"Error procesando fila {index + 1} en el archivo CSV. Fila omitida.")
-    return all_data
-
-# Función auxiliar para permitir la selección manual de columnas
-def get_column_selection(columns, label, key):
+            idle = now - os.path.getmtime(path)
+        except OSError:
+            continue
+        if path != own_dir and path not in in_use and idle > SPOOL_MAX_IDLE_SECONDS:
+            shutil.rmtree(path, ignore_errors=True)
+            logging.info(f"Directorio temporal inactivo {path} eliminado")
+
+# Función para ofrecer un archivo del disco para descarga; se lee solo cuando el usuario
+# hace clic, no en cada rerun
+def file_download_button(label, path, file_name, mime):
+    def read_file():
+        with open(path, "rb") as f:
+            return f.read()
+    st.download_button(label=label, data=read_file, file_name=file_name, mime=mime)
+
+# Función para leer solo el encabezado de un CSV
+def read_csv_header(path):
+    return pd.read_csv(path, dtype=str, nrows=0).columns
+
+# Función para obtener un libro parseado desde la caché (por hash de contenido) o parsearlo si no está
+def get_parsed_workbook(source, file_hash):
+    cache = get_workbook_cache()
+    with cache['lock']:
+        entries = cache['entries']
+        if file_hash in entries:
+            entries.move_to_end(file_hash)
+            return entries[file_hash]
+    parsed = probe_workbook(source)
+    logging.info(f"Libro parseado y almacenado en caché: {file_hash}")
+    with cache['lock']:
+        entries = cache['entries']
+        entries[file_hash] = parsed
+        while len(entries) > WORKBOOK_CACHE_MAX_ENTRIES:
+            evicted_hash, _ = entries.popitem(last=False)
+            logging.info(f"Libro {evicted_hash} expulsado de la caché")
+    return parsed
+
+# Función auxiliar para permitir la selección manual de columnas; las opciones son posiciones
+# para que los encabezados repetidos o vacíos no se confundan. Sin columnas devuelve -1
+def get_column_selection(columns, label, key, default_index=0):
     selection = st.selectbox(
         label,
-        options=columns,
-        index=0,
+        options=range(len(columns)),
+        index=default_index if columns else None,
+        format_func=lambda position: columns[position],
         key=key
     )
-    return selection
+    return -1 if selection is None else selection
+
+# Función para saber si una posición mapeada existe en un encabezado de num_columns columnas
+def is_valid_position(position, num_columns):
+    return isinstance(position, int) and 0 <= position < num_columns
+
+# Función para mostrar el nombre de la columna mapeada (o "No mapeado") en la vista previa
+def column_label(header_row, position):
+    if not is_valid_position(position, len(header_row)):
+        return "No mapeado"
+    return header_row[position]
+
+# Función para seleccionar manualmente las columnas de cada campo, preseleccionando las
+# que el índice de sinónimos reconoce o que ya se guardaron para el encabezado.
+# Devuelve (mapeo, campos que el usuario cambió respecto a la preselección)
+def select_mapping_manually(header_row, key_prefix):
+    columns = [cell if cell is not None else "" for cell in header_row]
+    suggested = {**resolve_header_fields(header_row), **(find_learned_mapping(header_row) or {})}
+    st.write("Selecciona las columnas correspondientes para cada campo requerido:")
+    mapping_indices = {
+        field: get_column_selection(columns, label=f"Selecciona columna para {field}:", key=f"{key_prefix}_{key_suffix}",
+                                    default_index=suggested.get(field, 0))
+        for field, key_suffix in MANUAL_FIELDS
+    }
+    changed = {field: position for field, position in mapping_indices.items() if position != suggested.get(field, 0)}
+    return mapping_indices, changed
+
+# Función auxiliar para mostrar los conteos de validación de una pestaña o archivo
+def show_validation(validation):
+    if validation:
+        st.caption(
+            f"ICCID con longitud inválida: {validation.get('iccid_longitud_invalida', 0)} | "
+            f"ICCID con dígito de control inválido: {validation.get('iccid_luhn_invalido', 0)} | "
+            f"ConsumoMb no numérico: {validation.get('consumo_no_numerico', 0)}"
+        )
+
+# Función auxiliar para mostrar las métricas de una pestaña o archivo
+def show_stats_metrics(stats):
+    processed = stats['processed']
+    inserted = stats['inserted']
+    insertion_rate = (inserted/processed*100) if processed > 0 else 0
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Registros Procesados", processed)
+    with col2:
+        st.metric("Registros Insertados", inserted)
+    with col3:
+        st.metric("Tasa de Inserción", f"{insertion_rate:.2f}%")
+    show_validation(stats.get('validation'))
+    dedup = stats.get('dedup')
+    if dedup and any(dedup.values()):
+        st.caption(
+            f"Repetidos descartados: {dedup.get('duplicados', 0)} | "
+            f"Reemplazados por prioridad: {dedup.get('reemplazados', 0)} | "
+            f"En conflicto con otra compañía: {dedup.get('conflictos', 0)}"
+        )
+
+# Avance de un trabajo en curso; el fragmento se vuelve a dibujar cada segundo sin rerun completo
+@st.fragment(run_every=1.0)
+def show_job_progress(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return
+    if job.finished:
+        st.rerun()
+    current = job.current_task
+    if current is None:
+        label = "En cola..."
+    elif current['sheet']:
+        label = f"Procesando {current['file']} | Pestaña: {current['sheet']}"
+    else:
+        label = f"Procesando {current['file']}"
+    st.progress(job.progress(), text=label)
+    st.write(f"Registros procesados: {job.total_records} | Registros insertados: {job.total_inserted}")
+    rows = []
+    with job.lock:
+        for task in job.tasks:
+            stats = job.task_stats(task)
+            total = task.get('total_rows')
+            rows.append({
+                'Archivo': task['file'],
+                'Pestaña': task['sheet'] or 'CSV',
+                'Procesados': stats['processed'],
+                'Insertados': stats['inserted'],
+                'Avance': min(stats['processed'] / total, 1.0) if total else None
+            })
+    st.dataframe(
+        pd.DataFrame(rows),
+        column_config={'Avance': st.column_config.ProgressColumn('Avance', min_value=0.0, max_value=1.0)},
+        hide_index=True
+    )
+    if job.cancel_event.is_set():
+        st.info("Cancelando...")
+    elif st.button("Cancelar Procesamiento", key=f"cancel_{job_id}"):
+        job.cancel()
+
+# Tabla y gráfico de tiempos por etapa (parse, extract, clean, dedup, insert, commit, export) de cada archivo y pestaña
+def show_stage_metrics(task_metrics):
+    records = [record for metrics in task_metrics for record in metrics.records()]
+    if not records:
+        return
+    df = pd.DataFrame(records)
+    df['Origen'] = df['file'] + df['sheet'].map(lambda sheet: f" | {sheet}" if sheet else " | CSV")
+    st.subheader("Tiempos por etapa")
+    st.dataframe(
+        df[['Origen', 'stage', 'seconds', 'rows', 'rows_per_second', 'bytes_read', 'memory_growth_mb']].rename(columns={
+            'stage': 'Etapa',
+            'seconds': 'Segundos',
+            'rows': 'Filas',
+            'rows_per_second': 'Filas/s',
+            'bytes_read': 'Bytes leídos',
+            'memory_growth_mb': 'Memoria adicional (MB)'
+        }),
+        hide_index=True
+    )
+    chart = df.pivot_table(index='Origen', columns='stage', values='seconds', aggfunc='sum')
+    st.bar_chart(chart[[stage for stage in STAGES if stage in chart.columns]])
+
+# Registros repetidos entre archivos y pestañas, y SIMs con estados distintos según la compañía
+def show_dedup_results(job):
+    dedup = job.dedup
+    if not (dedup.duplicates or dedup.replaced or dedup.conflicts):
+        return
+    st.write(f"Registros repetidos descartados: {dedup.duplicates}")
+    st.write(f"Registros reemplazados por una compañía de mayor prioridad: {dedup.replaced}")
+    if dedup.conflicts:
+        st.warning(f"{dedup.conflicts} SIMs aparecen en varias compañías con estados distintos.")
+        st.dataframe(
+            pd.DataFrame(
+                [(kept, other, count) for (kept, other), count in dedup.conflict_counts.items()],
+                columns=['Compañía prioritaria', 'Otra compañía', 'SIMs en conflicto']
+            ),
+            hide_index=True
+        )
+        file_download_button(
+            "Descargar Conflictos",
+            dedup.conflicts_path,
+            f"conflictos {os.path.splitext(os.path.basename(job.db_path))[0]}.csv",
+            "text/csv"
+        )
+
+# Resultados de un trabajo terminado, en pestañas, y descarga de la base generada
+def show_job_results(job):
+    if job.status == 'error':
+        st.error(f"El procesamiento falló: {job.error}")
+        return
+    tab1, tab2 = st.tabs(["Proceso", "Estadísticas"])
+
+    with tab1:
+        if job.status == 'cancelado':
+            st.warning("Procesamiento cancelado. La base contiene solo los registros cargados hasta ese momento.")
+        else:
+            st.success("¡Procesamiento completado!")
+        st.write(f"Total de registros procesados: {job.total_records}")
+        st.write(f"Total de registros insertados: {job.total_inserted}")
+        if job.db_mode == 'incremental':
+            st.write(f"Registros actualizados: {job.loader_counts.get('updated', 0)}")
+            st.write(f"Registros sin cambios (omitidos): {job.loader_counts.get('unchanged', 0)}")
+            st.write(f"Cambios registrados en la bitácora: {job.loader_counts.get('changes_logged', 0)}")
+        if job.rejects.rows:
+            st.warning(f"{job.rejects.rows} registros no pasaron la validación (ICCID o ConsumoMb).")
+            file_download_button(
+                "Descargar Rechazos",
+                job.rejects.path,
+                f"rechazos {os.path.splitext(os.path.basename(job.db_path))[0]}.csv",
+                "text/csv"
+            )
+        show_dedup_results(job)
+
+    with tab2:
+        st.header("Estadísticas de Procesamiento")
+        if job.total_records > 0:
+            st.write(f"Tasa de inserción total: {(job.total_inserted/job.total_records*100):.2f}%")
+        for file_name, stats in job.stats_by_file.items():
+            st.subheader(f"Archivo: {file_name}")
+            if 'sheets' in stats:  # Archivo Excel
+                for sheet, sheet_stats in stats['sheets'].items():
+                    st.write(f"Pestaña: {sheet}")
+                    show_stats_metrics(sheet_stats)
+            else:  # Archivo CSV
+                show_stats_metrics(stats)
+        show_stage_metrics(job.task_metrics)
+
+    # Se ofrece para descarga la base de datos generada
+    if job.status == 'completado':
+        file_download_button("Descargar Base de Datos", job.db_path, os.path.basename(job.db_path), "application/octet-stream")
+        # Exportaciones columnares, cada una en un zip con sus particiones o partes
+        base_name = os.path.splitext(os.path.basename(job.db_path))[0]
+        for fmt, path in job.export_files.items():
+            file_download_button(f"Descargar {EXPORT_FORMATS[fmt]}", path, f"{base_name} {fmt.split('.')[0]}.zip", "application/zip")
 
 # Interfaz de usuario con Streamlit
 st.title("Carga de Excel y CSV y Homologación de Base de Datos")
 
+# Comparación entre dos snapshots diarios, disponible en la barra lateral
+with st.sidebar:
+    st.header("Comparar Snapshots")
+    snapshots = list_snapshots()
+    if len(snapshots) < 2:
+        st.info("Se necesitan al menos dos bases 'dei Sims' generadas para comparar.")
+    else:
+        snapshot_names = [os.path.basename(path) for path in snapshots]
+        old_snapshot = st.selectbox("Snapshot anterior:", snapshot_names, index=len(snapshot_names) - 2, key="diff_old")
+        new_snapshot = st.selectbox("Snapshot nuevo:", snapshot_names, index=len(snapshot_names) - 1, key="diff_new")
+        diff_format = st.radio("Formato de salida:", ["csv", "parquet"], key="diff_format", horizontal=True)
+        if st.button("Comparar Snapshots"):
+            # El archivo de la comparación anterior ya no se puede descargar: se borra
+            previous = st.session_state.pop('diff_result', None)
+            if previous and os.path.exists(previous['path']):
+                os.remove(previous['path'])
+            diff_file = tempfile.NamedTemporaryFile(suffix=f".{diff_format}", delete=False)
+            diff_file.close()
+            try:
+                summary = diff_snapshots(
+                    snapshots[snapshot_names.index(old_snapshot)],
+                    snapshots[snapshot_names.index(new_snapshot)],
+                    diff_file.name,
+                    fmt=diff_format
+                )
+            except Exception:
+                os.remove(diff_file.name)
+                raise
+            st.session_state['diff_result'] = {
+                'summary': summary,
+                'path': diff_file.name,
+                'file_name': f"diferencias {old_snapshot[:-3]} vs {new_snapshot[:-3]}.{diff_format}"
+            }
+        diff_result = st.session_state.get('diff_result')
+        if diff_result:
+            if diff_result['summary']:
+                st.dataframe(pd.DataFrame.from_dict(diff_result['summary'], orient='index'))
+            else:
+                st.write("Sin diferencias entre los snapshots.")
+            file_download_button("Descargar Diferencias", diff_result['path'], diff_result['file_name'], "application/octet-stream")
+
+sweep_spool_dirs()
+
 # Permitir que el usuario suba archivos directamente
 uploaded_files = st.file_uploader("Carga los archivos Excel o CSV:", accept_multiple_files=True, type=["xlsx", "csv"])
 
 if uploaded_files:
     st.write(f"Archivos cargados: {[file.name for file in uploaded_files]}")
+    # Los archivos quitados del cargador se borran del disco, salvo que un trabajo los esté leyendo
+    running_job = get_job(st.session_state.get('job_id'))
+    if running_job is None or running_job.finished:
+        prune_spooled_uploads(uploaded_files)
+    spooled = {file.name: spool_upload(file) for file in uploaded_files}
     column_mapping = {}  # Almacenará el mapeo para cada archivo
 
-    # Para cada archivo cargado se crea un mapeo de columnas
+    # Para cada archivo cargado se crea un mapeo de columnas. Se intenta, en orden, el mapeo
+    # guardado para el encabezado, el predeterminado y la resolución por sinónimos; si nada
+    # aplica, los campos que el usuario cambie en la selección manual se guardan al procesar
+    learned_mappings = load_learned_mappings()
+    manual_mappings = []
     for file in uploaded_files:
-        file_bytes = file.getvalue()
         sheet_data = {}
         if file.name.endswith('.xlsx'):
-            workbook = openpyxl.load_workbook(BytesIO(file_bytes), data_only=True)
-            for sheet_name in workbook.sheetnames:
-                st.header(f"Archivo: {file.name} | Pestaña: {sheet_name}")
-                header_row = next(workbook[sheet_name].iter_rows(min_row=1, max_row=1, values_only=True))
-                if sheet_name in default_mappings:
-                    mapping = default_mappings[sheet_name]
-                    mapping_indices = {}
-                    mapping_valid = True
-                    for key_field, column_name in mapping.items():
-                        if column_name in header_row:
-                            mapping_indices[key_field] = header_row.index(column_name)
-                        else:
-                            st.warning(f"La columna '{column_name}' no se encontró en la pestaña '{sheet_name}' del archivo '{file.name}'. Se requiere selección manual.")
-                            mapping_valid = False
-                            break
-                    if mapping_valid:
-                        if 'ConsumoMb' in mapping:
-                            if mapping['ConsumoMb'] in header_row:
-                                mapping_indices['ConsumoMb'] = header_row.index(mapping['ConsumoMb'])
-                            else:
-                                mapping_indices['ConsumoMb'] = -1
-                        sheet_data[sheet_name] = mapping_indices
-                        st.info(f"Usando mapeo predeterminado para la pestaña '{sheet_name}' del archivo '{file.name}'.")
-                        logging.info(f"Archivo: {file.name} | Pestaña: {sheet_name} | Mapeo: {mapping_indices}")
-                    else:
-                        columns = [cell if cell is not None else "" for cell in header_row]
-                        st.write("Selecciona las columnas correspondientes para cada campo requerido:")
-                        iccid_col = get_column_selection(columns, label="Selecciona columna para ICCID:", key=f"{file.name}_{sheet_name}_iccid")
-                        telefono_col = get_column_selection(columns, label="Selecciona columna para TELEFONO:", key=f"{file.name}_{sheet_name}_telefono")
-                        estado_sim_col = get_column_selection(columns, label="Selecciona columna para ESTADO DEL SIM:", key=f"{file.name}_{sheet_name}_estado_sim")
-                        en_sesion_col = get_column_selection(columns, label="Selecciona columna para EN SESION:", key=f"{file.name}_{sheet_name}_en_sesion")
-                        consumo_mb_col = get_column_selection(columns, label="Selecciona columna para ConsumoMb:", key=f"{file.name}_{sheet_name}_consumo_mb")
-                        sheet_data[sheet_name] = {
-                            'ICCID': columns.index(iccid_col),
-                            'TELEFONO': columns.index(telefono_col),
-                            'ESTADO DEL SIM': columns.index(estado_sim_col),
-                            'EN SESION': columns.index(en_sesion_col),
-                            'ConsumoMb': columns.index(consumo_mb_col) if consumo_mb_col in columns else -1
-                        }
-                        logging.info(f"Archivo: {file.name} | Pestaña: {sheet_name} | Mapeo Manual: {sheet_data[sheet_name]}")
-                else:
-                    columns = [cell if cell is not None else "" for cell in next(workbook[sheet_name].iter_rows(min_row=1, max_row=1, values_only=True))]
-                    st.write("Selecciona las columnas correspondientes para cada campo requerido:")
-                    iccid_col = get_column_selection(columns, label="Selecciona columna para ICCID:", key=f"{file.name}_{sheet_name}_iccid")
-                    telefono_col = get_column_selection(columns, label="Selecciona columna para TELEFONO:", key=f"{file.name}_{sheet_name}_telefono")
-                    estado_sim_col = get_column_selection(columns, label="Selecciona columna para ESTADO DEL SIM:", key=f"{file.name}_{sheet_name}_estado_sim")
-                    en_sesion_col = get_column_selection(columns, label="Selecciona columna para EN SESION:", key=f"{file.name}_{sheet_name}_en_sesion")
-                    consumo_mb_col = get_column_selection(columns, label="Selecciona columna para ConsumoMb:", key=f"{file.name}_{sheet_name}_consumo_mb")
-                    sheet_data[sheet_name] = {
-                        'ICCID': columns.index(iccid_col),
-                        'TELEFONO': columns.index(telefono_col),
-                        'ESTADO DEL SIM': columns.index(estado_sim_col),
-                        'EN SESION': columns.index(en_sesion_col),
-                        'ConsumoMb': columns.index(consumo_mb_col) if consumo_mb_col in columns else -1
-                    }
-                    logging.info(f"Archivo: {file.name} | Pestaña: {sheet_name} | Mapeo Manual: {sheet_data[sheet_name]}")
+            workbook = get_parsed_workbook(spooled[file.name]['path'], spooled[file.name]['hash'])
+            sources = [(sheet_name, workbook['sheets'][sheet_name]['header']) for sheet_name in workbook['sheetnames']]
         elif file.name.endswith('.csv'):
-            df = pd.read_csv(BytesIO(file.getvalue()), dtype=str)
-            columns = df.columns.tolist()
-            st.header(f"Archivo: {file.name}")
-            st.write("Selecciona las columnas correspondientes para cada campo requerido:")
-            iccid_col = get_column_selection(columns, label="Selecciona columna para ICCID:", key=f"{file.name}_iccid")
-            telefono_col = get_column_selection(columns, label="Selecciona columna para TELEFONO:", key=f"{file.name}_telefono")
-            estado_sim_col = get_column_selection(columns, label="Selecciona columna para ESTADO DEL SIM:", key=f"{file.name}_estado_sim")
-            en_sesion_col = get_column_selection(columns, label="Selecciona columna para EN SESION:", key=f"{file.name}_en_sesion")
-            consumo_mb_col = get_column_selection(columns, label="Selecciona columna para ConsumoMb:", key=f"{file.name}_consumo_mb")
-            sheet_data[file.name] = {
-                'ICCID': df.columns.get_loc(iccid_col),
-                'TELEFONO': df.columns.get_loc(telefono_col),
-                'ESTADO DEL SIM': df.columns.get_loc(estado_sim_col),
-                'EN SESION': df.columns.get_loc(en_sesion_col),
-                'ConsumoMb': df.columns.get_loc(consumo_mb_col) if consumo_mb_col in df.columns else -1
-            }
-            logging.info(f"Archivo: {file.name} | CSV | Mapeo Manual: {sheet_data[file.name]}")
+            sources = [(file.name, tuple(read_csv_header(spooled[file.name]['path'])))]
+        else:
+            sources = []
+        for sheet_name, header_row in sources:
+            is_csv = file.name.endswith('.csv')
+            where = f"el archivo '{file.name}'" if is_csv else f"la pestaña '{sheet_name}' del archivo '{file.name}'"
+            key_prefix = file.name if is_csv else f"{file.name}_{sheet_name}"
+            st.header(f"Archivo: {file.name}" if is_csv else f"Archivo: {file.name} | Pestaña: {sheet_name}")
+            lookup_name = os.path.splitext(file.name)[0] if is_csv else sheet_name
+            profile, mapping_indices = find_default_mapping(lookup_name, header_row)
+            if mapping_indices is not None:
+                sheet_data[sheet_name] = mapping_indices
+                if header_signature(header_row) in learned_mappings:
+                    st.info(f"Usando el mapeo guardado para {where}.")
+                    if st.button("Olvidar mapeo guardado", key=f"{key_prefix}_forget"):
+                        forget_learned_mapping(header_row)
+                        st.rerun()
+                elif profile in default_mappings:
+                    st.info(f"Usando mapeo predeterminado '{profile}' para {where}.")
+                else:
+                    st.info(f"Mapeo resuelto por nombres de columna para {where}.")
+                logging.info(f"Archivo: {file.name} | {'CSV' if is_csv else f'Pestaña: {sheet_name}'} | Mapeo: {mapping_indices}")
+            else:
+                if sheet_name in default_mappings:
+                    st.warning(f"Las columnas del mapeo predeterminado no se encontraron en {where}. Se requiere selección manual.")
+                sheet_data[sheet_name], changed = select_mapping_manually(header_row, key_prefix)
+                if changed:
+                    manual_mappings.append((header_row, changed))
+                logging.info(f"Archivo: {file.name} | {'CSV' if is_csv else f'Pestaña: {sheet_name}'} | Mapeo Manual: {sheet_data[sheet_name]}")
         column_mapping[file.name] = sheet_data
 
     # Vista previa del mapeo de columnas
     st.subheader("Vista Previa de Mapeo de Columnas")
     for file in uploaded_files:
-        file_bytes = file.getvalue()
         if file.name.endswith('.xlsx'):
-            workbook = openpyxl.load_workbook(BytesIO(file_bytes), data_only=True)
+            workbook = get_parsed_workbook(spooled[file.name]['path'], spooled[file.name]['hash'])
             for sheet, mapping in column_mapping[file.name].items():
                 st.write(f"**Archivo:** {file.name} | **Pestaña:** {sheet}")
-                header_row = next(workbook[sheet].iter_rows(min_row=1, max_row=1, values_only=True))
-                st.write(f" - ICCID: {header_row[mapping['ICCID']]}")
-                st.write(f" - TELEFONO: {header_row[mapping['TELEFONO']]}")
-                st.write(f" - ESTADO DEL SIM: {header_row[mapping['ESTADO DEL SIM']]}")
-                st.write(f" - EN SESION: {header_row[mapping['EN SESION']]}")
-                if mapping.get('ConsumoMb', -1) != -1:
-                    st.write(f" - ConsumoMb: {header_row[mapping['ConsumoMb']]}")
-                else:
-                    st.write(" - ConsumoMb: No mapeado")
+                header_row = workbook['sheets'][sheet]['header']
+                for key in ['ICCID', 'TELEFONO', 'ESTADO DEL SIM', 'EN SESION', 'ConsumoMb']:
+                    st.write(f" - {key}: {column_label(header_row, mapping.get(key))}")
         elif file.name.endswith('.csv'):
-            df = pd.read_csv(BytesIO(file.getvalue()), dtype=str)
-            mapping = column_mapping[file.name]
+            csv_columns = read_csv_header(spooled[file.name]['path'])
+            mapping = column_mapping[file.name][file.name]
             st.write(f"**Archivo CSV:** {file.name}")
-            st.write(f" - ICCID: {df.columns[mapping['ICCID']]}")
-            st.write(f" - TELEFONO: {df.columns[mapping['TELEFONO']]}")
-            st.write(f" - ESTADO DEL SIM: {df.columns[mapping['ESTADO DEL SIM']]}")
-            st.write(f" - EN SESION: {df.columns[mapping['EN SESION']]}")
-            if mapping.get('ConsumoMb', -1) != -1:
-                st.write(f" - ConsumoMb: {df.columns[mapping['ConsumoMb']]}")
-            else:
-                st.write(" - ConsumoMb: No mapeado")
+            for key in ['ICCID', 'TELEFONO', 'ESTADO DEL SIM', 'EN SESION', 'ConsumoMb']:
+                st.write(f" - {key}: {column_label(csv_columns, mapping.get(key))}")
     
     # Botón para procesar todos los archivos subidos
-    if st.button("Procesar Todos los Archivos"):
+    # Tipo de base a generar: la diaria de texto, la diaria normalizada (compacta) o el
+    # almacén persistente incremental, que se actualiza en lugar de reconstruirse
+    db_modes = {
+        "Diaria": 'daily',
+        "Diaria normalizada (compacta)": 'normalized',
+        "Incremental (actualizar la base persistente)": 'incremental'
+    }
+    db_mode = db_modes[st.radio("Tipo de base de datos:", list(db_modes), key="db_mode", horizontal=True)]
+    incremental_mode = db_mode == 'incremental'
+    db_path = PERSISTENT_DB_FILENAME if incremental_mode else output_filename
+
+    # Compañías presentes en la carga (pestañas de Excel; los CSV se cargan como "CSV"). Si una
+    # misma clave ICCID/TELEFONO aparece en varias, se conserva la de la compañía más prioritaria
+    companias = []
+    for file in uploaded_files:
+        if file.name.endswith('.xlsx'):
+            names = get_parsed_workbook(spooled[file.name]['path'], spooled[file.name]['hash'])['sheetnames']
+        else:
+            names = ["CSV"]
+        companias.extend(name for name in names if name not in companias)
+    precedence = st.multiselect(
+        "Prioridad de compañías ante registros repetidos (la primera tiene mayor prioridad):",
+        companias,
+        key="precedence",
+        help="Las compañías no seleccionadas quedan después, en el orden en que se procesan."
+    )
+
+    # Formatos columnares a generar además de la base, a partir de los mismos lotes
+    exports = st.multiselect(
+        "Exportar también en:",
+        list(EXPORT_FORMATS),
+        format_func=EXPORT_FORMATS.get,
+        key="exports"
+    )
+
+    # Mientras haya un trabajo en curso no se puede lanzar otro
+    job = get_job(st.session_state.get('job_id'))
+    job_running = job is not None and not job.finished
+
+    if st.button("Procesar Todos los Archivos", disabled=job_running):
         all_mappings_valid = True
-        stats_by_file = {}
-        total_records = 0
-        total_inserted = 0
 
         # Validación de mapeos
         for file in uploaded_files:
-            file_bytes = file.getvalue()
             if file.name.endswith('.xlsx'):
-                workbook = openpyxl.load_workbook(BytesIO(file_bytes), data_only=True)
-                stats_by_file[file.name] = {'sheets': {}}
-                for sheet_name in workbook.sheetnames:
-                    num_columns = workbook[sheet_name].max_column
+                workbook = get_parsed_workbook(spooled[file.name]['path'], spooled[file.name]['hash'])
+                for sheet_name in workbook['sheetnames']:
+                    num_columns = workbook['sheets'][sheet_name]['max_column']
                     for key in ['ICCID', 'TELEFONO', 'ESTADO DEL SIM', 'EN SESION', 'ConsumoMb']:
-                        if key == 'ConsumoMb' and column_mapping[file.name][sheet_name][key] == -1:
+                        position = column_mapping[file.name][sheet_name].get(key)
+                        if key == 'ConsumoMb' and position in (None, -1):
                             st.warning(f"La columna 'ConsumoMb' no está mapeada para la pestaña '{sheet_name}' del archivo '{file.name}'. Se establecerá como NULL.")
-                        elif key != 'ConsumoMb' and not (0 <= column_mapping[file.name][sheet_name][key] < num_columns):
+                        elif key != 'ConsumoMb' and not is_valid_position(position, num_columns):
                             st.error(f"Mapeo inválido para '{key}' en la pestaña '{sheet_name}' del archivo '{file.name}'.")
                             all_mappings_valid = False
             elif file.name.endswith('.csv'):
-                df = pd.read_csv(BytesIO(file.getvalue()), dtype=str)
-                mapping = column_mapping[file.name]
-                num_columns = len(df.columns)
+                mapping = column_mapping[file.name][file.name]
+                num_columns = len(read_csv_header(spooled[file.name]['path']))
                 for key in ['ICCID', 'TELEFONO', 'ESTADO DEL SIM', 'EN SESION', 'ConsumoMb']:
-                    if key == 'ConsumoMb' and mapping[key] == -1:
+                    position = mapping.get(key)
+                    if key == 'ConsumoMb' and position in (None, -1):
                         st.warning(f"La columna 'ConsumoMb' no está mapeada para el archivo CSV '{file.name}'. Se establecerá como NULL.")
-                    elif key != 'ConsumoMb' and not (0 <= mapping[key] < num_columns):
+                    elif key != 'ConsumoMb' and not is_valid_position(position, num_columns):
                         st.error(f"Mapeo inválido para '{key}' en el archivo CSV '{file.name}'.")
                         all_mappings_valid = False
 
         if not all_mappings_valid:
             st.error("Por favor, revisa los mapeos de columnas y corrige los errores antes de proceder.")
         else:
-            # Elimina el archivo de BD si existe para que cada ejecución sea independiente
-            if os.path.exists(output_filename):
-                os.remove(output_filename)
-                logging.info(f"Archivo existente {output_filename} eliminado para nueva ejecución.")
-            
-            create_database(output_filename)
-            logging.info(f"Base de datos creada: {output_filename}")
-
+            # Solo se guardan los campos que el usuario eligió; las preselecciones sin tocar no
+            # cuentan como confirmadas
+            for header_row, changed in manual_mappings:
+                save_learned_mapping(header_row, changed)
+            # El procesamiento corre en segundo plano; la sesión solo guarda el id del trabajo
+            tasks = []
             for file in uploaded_files:
-                file_bytes = file.getvalue()
+                upload = spooled[file.name]
                 if file.name.endswith('.xlsx'):
-                    workbook = openpyxl.load_workbook(BytesIO(file_bytes), data_only=True)
-                    stats_by_file[file.name] = {'sheets': {}}
-                    for sheet_name in workbook.sheetnames:
-                        data = process_excel(file_bytes, column_mapping[file.name][sheet_name], sheet_name)
-                        if data:
-                            processed, inserted = insert_data(output_filename, data)
-                            stats_by_file[file.name]['sheets'][sheet_name] = {
-                                'processed': processed,
-                                'inserted': inserted
-                            }
-                            total_records += processed
-                            total_inserted += inserted
+                    workbook = get_parsed_workbook(upload['path'], upload['hash'])
+                    for sheet_name in workbook['sheetnames']:
+                        tasks.append({
+                            'kind': 'xlsx',
+                            'file': file.name,
+                            'sheet': sheet_name,
+                            'source': upload['path'],
+                            'mapping': column_mapping[file.name][sheet_name],
+                            'sheet_bytes': workbook['sheets'][sheet_name]['bytes'],
+                            'total_rows': workbook['sheets'][sheet_name].get('data_rows')
+                        })
                 elif file.name.endswith('.csv'):
-                    data = process_csv(file_bytes, column_mapping[file.name])
-                    if data:
-                        processed, inserted = insert_data(output_filename, data)
-                        stats_by_file[file.name] = {
-                            'processed': processed,
-                            'inserted': inserted
-                        }
-                        total_records += processed
-                        total_inserted += inserted
-
-            # Mostrar resultados en pestañas
-            tab1, tab2 = st.tabs(["Proceso", "Estadísticas"])
-            
-            with tab1:
-                st.success("¡Procesamiento completado!")
-                st.write(f"Total de registros procesados: {total_records}")
-                st.write(f"Total de registros insertados: {total_inserted}")
-                
-            with tab2:
-                st.header("Estadísticas de Procesamiento")
-                if total_records > 0:
-                    st.write(f"Tasa de inserción total: {(total_inserted/total_records*100):.2f}%")
-                for file_name, stats in stats_by_file.items():
-                    st.subheader(f"Archivo: {file_name}")
-                    if 'sheets' in stats:  # Archivo Excel
-                        for sheet, sheet_stats in stats['sheets'].items():
-                            processed = sheet_stats['processed']
-                            inserted = sheet_stats['inserted']
-                            insertion_rate = (inserted/processed*100) if processed > 0 else 0
-                            st.write(f"Pestaña: {sheet}")
-                            col1, col2, col3 = st.columns(3)
-                            with col1:
-                                st.metric("Registros Procesados", processed)
-                            with col2:
-                                st.metric("Registros Insertados", inserted)
-                            with col3:
-                                st.metric("Tasa de Inserción", f"{insertion_rate:.2f}%")
-                    else:  # Archivo CSV
-                        processed = stats['processed']
-                        inserted = stats['inserted']
-                        insertion_rate = (inserted/processed*100) if processed > 0 else 0
-                        col1, col2, col3 = st.columns(3)
-                        with col1:
-                            st.metric("Registros Procesados", processed)
-                        with col2:
-                            st.metric("Registros Insertados", inserted)
-                        with col3:
-                            st.metric("Tasa de Inserción", f"{insertion_rate:.2f}%")
-            
-            # Se ofrece para descarga la base de datos generada
-            with open(output_filename, "rb") as f:
-                db_bytes = f.read()
-            st.download_button(
-                label="Descargar Base de Datos",
-                data=db_bytes,
-                file_name=output_filename,
-                mime="application/octet-stream"
-            )
+                    tasks.append({
+                        'kind': 'csv',
+                        'file': file.name,
+                        'sheet': None,
+                        'source': upload['path'],
+                        'mapping': column_mapping[file.name][file.name],
+                        'total_rows': max(upload['lines'] - 1, 0)
+                    })
+            st.session_state['job_id'] = submit_job(tasks, db_path, db_mode, precedence, exports)
+            job = get_job(st.session_state['job_id'])
+
+    # Avance o resultados del último trabajo lanzado en esta sesión
+    if job is not None:
+        if not job.finished:
+            show_job_progress(job.id)
+        else:
+            show_job_results(job)
 else:
+    # Sin archivos en el cargador no se conserva ninguna copia, salvo que un trabajo la esté leyendo
+    running_job = get_job(st.session_state.get('job_id'))
+    if running_job is None or running_job.finished:
+        prune_spooled_uploads([])
     st.error("Por favor, sube al menos un archivo Excel o CSV.")
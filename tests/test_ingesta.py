@@ -0,0 +1,247 @@
+import csv
+import gzip
+import sqlite3
+
+import numpy as np
+import openpyxl
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from cleaning import clean_batch, parse_mb_column, validate_iccid_column
+from database import IncrementalSimsLoader, NormalizedSimsLoader, SimsLoader, canonical_key, key_text_sql
+from dedup import KeyTable
+from exports import CsvGzipExporter, ParquetExporter
+from extraction import parse_workbook, probe_workbook
+from mappings import find_default_mapping, save_learned_mapping
+from snapshot_diff import diff_snapshots
+
+# Claves válidas de ejemplo (ICCID, TELEFONO)
+KEY_A = ('8952000000000000001', '5500000001')
+KEY_B = ('8952000000000000002', '5500000002')
+
+# Función para comparar probe_workbook con parse_workbook: el tamaño de cada hoja solo lo
+# conoce probe_workbook
+def without_bytes(parsed):
+    return {
+        'sheetnames': parsed['sheetnames'],
+        'sheets': {name: {key: value for key, value in sheet.items() if key != 'bytes'} for name, sheet in parsed['sheets'].items()},
+    }
+
+def test_key_table_finds_existing_keys_and_keeps_values():
+    table = KeyTable(capacity=8)
+    keys = np.array([5, 13, 21, 0], dtype=np.uint64)  # 5, 13 y 21 caen en la misma posición
+    found, slots = table.upsert(keys, np.array([50, 130, 210, 7], dtype=np.uint64))
+    assert not found.any()
+    assert table.size == 4
+    assert table.values[slots].tolist() == [50, 130, 210, 7]
+
+    found, slots = table.upsert(np.array([13, 99, 0], dtype=np.uint64), np.array([1, 990, 1], dtype=np.uint64))
+    assert found.tolist() == [True, False, True]
+    # Una clave existente conserva su valor; la clave 0 se guarda como 1
+    assert table.values[slots].tolist() == [130, 990, 7]
+    assert table.size == 5
+
+def test_key_table_grows_without_losing_keys():
+    table = KeyTable(capacity=8)
+    keys = np.arange(1, 101, dtype=np.uint64) * np.uint64(8)
+    table.upsert(keys, keys * np.uint64(2))
+    assert len(table.keys) >= 100 / 0.7
+    found, slots = table.upsert(keys, np.zeros(len(keys), dtype=np.uint64))
+    assert found.all()
+    assert (table.values[slots] == keys * np.uint64(2)).all()
+
+def test_probe_workbook_matches_parse_workbook(tmp_path):
+    path = tmp_path / 'libro.xlsx'
+    workbook = openpyxl.Workbook()
+    telcel = workbook.active
+    telcel.title = 'TELCEL'
+    telcel.append(['ICCID', None, 'Estado', 12])
+    telcel.append(['8952', 'x', 'Activo', 3, 'extra'])
+    sparse = workbook.create_sheet('SIN FILA 1')
+    sparse['B2'] = 'ICCID'
+    sparse['C3'] = 'dato'
+    workbook.create_sheet('VACIA')
+    workbook.save(path)
+
+    probed = probe_workbook(str(path))
+    assert without_bytes(probed) == without_bytes(parse_workbook(str(path)))
+    assert probed['sheets']['TELCEL']['header'] == ('ICCID', None, 'Estado', 12, None)
+    # Solo la fila 1 es encabezado, aunque la hoja empiece más abajo
+    assert set(probed['sheets']['SIN FILA 1']['header']) == {None}
+    assert all(sheet['bytes'] > 0 for sheet in probed['sheets'].values())
+
+def test_incremental_upsert_logs_changes(tmp_path):
+    db_path = str(tmp_path / 'sims.db')
+    with IncrementalSimsLoader(db_path) as loader:
+        assert loader.insert([(*KEY_A, 'activo', 'no', '1', 'TELCEL'), (*KEY_B, 'activo', 'no', '2', 'TELCEL')]) == (2, 2)
+
+    with IncrementalSimsLoader(db_path) as loader:
+        new_key = ('8952000000000000003', '5500000003')
+        processed, inserted = loader.insert([
+            (*KEY_A, 'activo', 'no', '1', 'TELCEL'),
+            (*KEY_B, 'suspendido', 'no', '2', 'TELCEL'),
+            (*new_key, 'activo', 'sí', '0', 'TELCEL'),
+        ])
+        assert (processed, inserted) == (3, 1)
+        assert (loader.updated, loader.unchanged, loader.changes_logged) == (1, 1, 1)
+        # Un reemplazo actualiza la fila pero no se cuenta otra vez como procesado
+        assert loader.replace([(*KEY_A, 'activo', 'no', '1', 'MOVISTAR')]) == 1
+        assert (loader.processed, loader.inserted, loader.updated, loader.changes_logged) == (3, 1, 2, 1)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        changes = conn.execute("SELECT ICCID, TELEFONO, Campo, Anterior, Nuevo FROM sims_changes").fetchall()
+        estado = conn.execute("SELECT ESTADO_DEL_SIM FROM sims WHERE ICCID = ? AND TELEFONO = ?", KEY_B).fetchone()[0]
+        total = conn.execute("SELECT COUNT(*) FROM sims").fetchone()[0]
+        compania = conn.execute("SELECT Compania FROM sims WHERE ICCID = ? AND TELEFONO = ?", KEY_A).fetchone()[0]
+    finally:
+        conn.close()
+    assert changes == [(*KEY_B, 'ESTADO_DEL_SIM', 'activo', 'suspendido')]
+    assert compania == 'MOVISTAR'
+    assert estado == 'suspendido'
+    assert total == 3
+
+def test_parquet_export_drops_superseded_rows(tmp_path):
+    exporter = ParquetExporter(str(tmp_path / 'parquet'))
+    exporter.write([(*KEY_A, 'activo', 'no', '1', 'CSV'), (*KEY_B, 'activo', 'no', '2', 'CSV')])
+    exporter.replace([(*KEY_A, 'suspendido', 'no', '3', 'TELCEL')])
+    exporter.close()
+
+    table = ds.dataset(exporter.directory, format='parquet', partitioning='hive').to_table()
+    rows = sorted(zip(*(table[name].to_pylist() for name in ('ICCID', 'TELEFONO', 'Compania'))))
+    assert rows == [(*KEY_A, 'TELCEL'), (*KEY_B, 'CSV')]
+    assert exporter.rows == 2
+
+def test_csv_export_drops_superseded_rows_across_parts(tmp_path):
+    exporter = CsvGzipExporter(str(tmp_path / 'csv'), chunk_rows=1)
+    exporter.write([(*KEY_A, 'activo', 'no', '1', 'CSV'), (*KEY_B, 'activo', 'no', '2', 'CSV')])
+    exporter.replace([(*KEY_A, 'suspendido', 'no', '3', 'TELCEL')])
+    exporter.close()
+
+    rows = []
+    for path in exporter.paths:
+        with gzip.open(path, 'rt', newline='', encoding='utf-8') as f:
+            rows.extend((row['ICCID'], row['TELEFONO'], row['Compania']) for row in csv.DictReader(f))
+    assert sorted(rows) == [(*KEY_A, 'TELCEL'), (*KEY_B, 'CSV')]
+    assert len(exporter.paths) == 3
+
+def test_snapshot_diff_keeps_sims_that_share_an_iccid(tmp_path):
+    iccid = '8952000000000000001'
+    old_db, new_db, output = str(tmp_path / 'old.db'), str(tmp_path / 'new.db'), str(tmp_path / 'diff.csv')
+    with SimsLoader(old_db) as loader:
+        loader.insert([(iccid, '5500000001', 'activo', 'no', '1', 'TELCEL'), (iccid, '5500000002', 'activo', 'no', '1', 'TELCEL')])
+    with NormalizedSimsLoader(new_db) as loader:
+        loader.insert([(iccid, '5500000001', 'suspendido', 'no', '1', 'TELCEL')])
+
+    summary = diff_snapshots(old_db, new_db, output)
+    assert summary == {'TELCEL': {'agregadas': 0, 'eliminadas': 1, 'cambiadas': 1, 'cambio_estado': 1, 'cambio_compania': 0}}
+    with open(output, newline='', encoding='utf-8') as f:
+        rows = sorted((row['tipo'], row['TELEFONO']) for row in csv.DictReader(f))
+    assert rows == [('cambiada', '5500000001'), ('eliminada', '5500000002')]
+
+# Función para completar un número con su dígito de control Luhn
+def luhn_complete(partial):
+    total = 0
+    for i, char in enumerate(reversed(partial)):
+        digit = int(char) * (2 if i % 2 == 0 else 1)
+        total += digit - 9 if digit > 9 else digit
+    return partial + str((10 - total % 10) % 10)
+
+def test_clean_batch_normalizes_values():
+    iccid = luhn_complete('895200000000000001')
+    batch = [
+        (iccid, '5500000001.0', ' Activo ', 'SÍ', '1.5 GB', 'TELCEL'),
+        (iccid, '0055-0000-0002', 'activo', 'no', '1,234', 'TELCEL'),
+        (iccid, '5500000003', None, float('nan'), '12,5 MB', 'TELCEL'),
+        (iccid, None, 'baja', 'no', None, 'TELCEL'),
+    ]
+    rows, report = clean_batch(batch)
+    assert rows == [
+        (iccid, '5500000001', 'activo', 'sí', '1536', 'TELCEL'),
+        (iccid, '005500000002', 'activo', 'no', '1234', 'TELCEL'),
+        (iccid, '5500000003', '', '', '12.5', 'TELCEL'),
+        (iccid, '', 'baja', 'no', '', 'TELCEL'),
+    ]
+    assert report == {'iccid_longitud_invalida': 0, 'iccid_luhn_invalido': 0, 'consumo_no_numerico': 0}
+
+def test_clean_batch_validates_iccid_and_consumo():
+    valid_19 = luhn_complete('895200000000000001')
+    valid_20 = luhn_complete('8952000000000000001')
+    invalid_19 = valid_19[:-1] + str((int(valid_19[-1]) + 1) % 10)
+    invalid_20 = valid_20[:-1] + str((int(valid_20[-1]) + 1) % 10)
+    batch = [
+        (valid_19, '1', '', '', '1', 'X'),
+        (valid_20, '2', '', '', '1 kb', 'X'),
+        (invalid_19, '3', '', '', '1', 'X'),
+        (invalid_20, '4', '', '', '1', 'X'),
+        ('8952', '5', '', '', '1', 'X'),
+        (valid_19, '6', '', '', 'n/a', 'X'),
+    ]
+    rejects = []
+    rows, report = clean_batch(batch, rejects)
+    assert len(rows) == len(batch)
+    assert report == {'iccid_longitud_invalida': 1, 'iccid_luhn_invalido': 2, 'consumo_no_numerico': 1}
+    assert [(reason, row[1]) for reason, *row in rejects] == [
+        ('iccid_luhn_invalido', '3'),
+        ('iccid_luhn_invalido', '4'),
+        ('iccid_longitud_invalida', '5'),
+        ('consumo_no_numerico', '6'),
+    ]
+
+def test_parse_mb_column_converts_units_and_separators():
+    values = parse_mb_column(pa.array(['1.5 GB', '1,234', '12,5 MB', '512 kb', '7', 'n/a', '']))
+    assert values[:5].tolist() == [1536.0, 1234.0, 12.5, 0.5, 7.0]
+    assert np.isnan(values[5:]).all()
+
+def test_validate_iccid_column_checks_length_and_luhn():
+    valid_19 = luhn_complete('895200000000000001')
+    valid_20 = luhn_complete('8952000000000000001')
+    digits = [valid_19, valid_20, valid_19[:-1] + str((int(valid_19[-1]) + 1) % 10),
+              valid_20[:-1] + str((int(valid_20[-1]) + 1) % 10), '0' + valid_19, '8952']
+    length_ok, luhn_ok = validate_iccid_column(pa.array(digits))
+    assert length_ok.tolist() == [True, True, True, True, True, False]
+    # Un cero a la izquierda no cambia el dígito de control
+    assert luhn_ok.tolist()[:5] == [True, True, False, False, True]
+
+def test_canonical_key_round_trips_through_sims_view(tmp_path):
+    keys = [
+        '8952000000000000001',    # 19 dígitos, cabe en un entero
+        '89520000000000000018',   # 20 dígitos con prefijo 89, se empaca en negativo
+        '89000000000000000000',
+        '89999999999999999999',
+        '0895200000000000001',    # ceros a la izquierda, queda como texto
+        '0055000001',
+        '99999999999999999999',   # supera 64 bits sin prefijo 89, queda como texto
+        '9223372036854775808',
+    ]
+    assert [type(canonical_key(key)) for key in keys] == [int, int, int, int, str, str, str, str]
+    conn = sqlite3.connect(':memory:')
+    try:
+        decoded = [conn.execute(f"SELECT {key_text_sql(':key')}", {'key': canonical_key(key)}).fetchone()[0] for key in keys]
+    finally:
+        conn.close()
+    assert decoded == keys
+
+    db_path = str(tmp_path / 'sims.db')
+    with NormalizedSimsLoader(db_path) as loader:
+        loader.insert([(key, key, 'activo', 'no', '1', 'TELCEL') for key in keys])
+    conn = sqlite3.connect(db_path)
+    try:
+        stored = conn.execute("SELECT ICCID, TELEFONO FROM sims").fetchall()
+        found = conn.execute("SELECT COUNT(*) FROM sims WHERE ICCID = ?", (keys[1],)).fetchone()[0]
+        types = dict(conn.execute("SELECT TELEFONO, typeof(ICCID) FROM sims_compact"))
+    finally:
+        conn.close()
+    assert sorted(stored) == sorted((key, key) for key in keys)
+    assert found == 1
+    assert [types[canonical_key(key)] for key in keys] == ['integer'] * 4 + ['text'] * 4
+
+def test_partial_learned_mapping_completes_with_synonyms(tmp_path):
+    path = str(tmp_path / 'mapeos.json')
+    header = ('ICCID', 'Linea', 'Estatus', 'Conectado', 'Datos')
+    assert find_default_mapping('RARO', header, learned_path=path) == (None, None)
+    save_learned_mapping(header, {'TELEFONO': 1, 'ESTADO DEL SIM': 2}, path=path)
+    assert find_default_mapping('RARO', header, learned_path=path) == (None, None)
+    save_learned_mapping(header, {'EN SESION': 3}, path=path)
+    assert find_default_mapping('RARO', header, learned_path=path) == (
+        'RARO', {'ICCID': 0, 'TELEFONO': 1, 'ESTADO DEL SIM': 2, 'EN SESION': 3, 'ConsumoMb': -1})